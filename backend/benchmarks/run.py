@@ -0,0 +1,327 @@
+"""
+Offline benchmark harness for the ingest and query paths.
+
+    cd backend
+    python -m benchmarks.run --output benchmarks/results/latest.json
+    python -m benchmarks.run --baseline benchmarks/results/latest.json   # exits 1 on regressions
+
+Runs against data/sample.pdf and synthetic PDFs with the deterministic hash
+embedder and FakeLLM, so results only measure this codebase. All state lives
+in a temporary directory; VECTOR_DB_TYPE and the other settings still apply.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Settings are read at import time, so the environment is fixed before anything imports config.
+# Spawned extraction workers inherit RAG_BENCH_DIR instead of creating another directory.
+BENCH_DIR = os.environ.get("RAG_BENCH_DIR") or tempfile.mkdtemp(prefix="rag-bench-")
+for _name, _value in {
+    "RAG_BENCH_DIR": BENCH_DIR,
+    "EMBEDDING_BACKEND": "hash",
+    "LLM_BACKEND": "fake",
+    "COHERE_API_KEY": "offline",
+    "CHROMA_PERSIST_DIR": os.path.join(BENCH_DIR, "chroma_db"),
+    "VECTOR_DB_PATH": os.path.join(BENCH_DIR, "vector_store"),
+    "PDF_UPLOAD_PATH": os.path.join(BENCH_DIR, "uploads"),
+    "DOCUMENT_REGISTRY_PATH": os.path.join(BENCH_DIR, "document_registry.sqlite3"),
+    "EMBEDDING_CACHE_PATH": os.path.join(BENCH_DIR, "embedding_cache", "embeddings.sqlite3"),
+    "LEXICAL_INDEX_PATH": os.path.join(BENCH_DIR, "lexical_index.sqlite3"),
+    "TABLE_STORE_PATH": os.path.join(BENCH_DIR, "table_store"),
+    "CONVERSATION_STORE_PATH": os.path.join(BENCH_DIR, "conversations.sqlite3"),
+    "PAGE_STORE_PATH": os.path.join(BENCH_DIR, "page_store.sqlite3"),
+    # Every chat request should take the full retrieval and generation path
+    "ANSWER_CACHE_ENABLED": "false",
+    "SIMILARITY_THRESHOLD": "0",
+    "LOG_LEVEL": "WARNING",
+}.items():
+    os.environ[_name] = _value
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from langchain.schema import Document  # noqa: E402
+
+from benchmarks.synthetic import make_pdf  # noqa: E402
+from config import settings  # noqa: E402
+from services.pdf_processor import PDFProcessor  # noqa: E402
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "..", "..", "data", "sample.pdf")
+QUESTIONS = [
+    "What was the revenue in {year}?",
+    "How did operating income change compared to the previous year?",
+    "What were the finance costs in {year}?",
+    "Summarize the capital expenditure plans.",
+    "What is the dividend policy?",
+    "How much cash and cash equivalents did the company hold in {year}?",
+    "What risks does management expect next year?",
+    "What was the net income margin in {year}?",
+]
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+
+def bench_extraction(pdfs: Dict[str, str]) -> Tuple[Dict[str, Any], List[Document]]:
+    """Pages/sec through PDFProcessor.iter_pages on a process pool, plus chunking time"""
+    processor = PDFProcessor(chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap)
+    results: Dict[str, Any] = {}
+    chunks: List[Document] = []
+    with ProcessPoolExecutor(max_workers=settings.ingest_extract_workers,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Start the workers before timing anything
+        list(processor.iter_pages(SAMPLE_PDF, executor=pool))
+        for name, path in pdfs.items():
+            start = time.perf_counter()
+            pages = list(processor.iter_pages(path, executor=pool))
+            extract_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            documents = list(processor.split_into_chunks(pages, f"bench-{name}", os.path.basename(path)))
+            split_seconds = time.perf_counter() - start
+            results[name] = {
+                "pages": len(pages),
+                "chunks": len(documents),
+                "extract_seconds": extract_seconds,
+                "pages_per_sec": len(pages) / extract_seconds,
+                "split_seconds": split_seconds,
+                "chunks_per_sec": len(documents) / split_seconds if split_seconds else None,
+            }
+            if len(documents) > len(chunks):
+                chunks = documents
+    return results, chunks
+
+
+def bench_add_documents(vector_store, chunks: List[Document]) -> Dict[str, Any]:
+    """Chunks/sec for vector_store.add_documents in ingestion-sized batches, cold embedding cache"""
+    document_id = "bench-add-documents"
+    batch_size = settings.embedding_batch_size
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(chunks), batch_size):
+        batch = [
+            Document(page_content=doc.page_content, metadata=dict(doc.metadata, document_id=document_id))
+            for doc in chunks[i:i + batch_size]
+        ]
+        batch_start = time.perf_counter()
+        vector_store.add_documents(batch)
+        latencies.append(time.perf_counter() - batch_start)
+    elapsed = time.perf_counter() - start
+    delete_start = time.perf_counter()
+    vector_store.delete_by_document_id(document_id)
+    return {
+        "chunks": len(chunks),
+        "batch_size": batch_size,
+        "seconds": elapsed,
+        "chunks_per_sec": len(chunks) / elapsed,
+        "batch": _percentiles(latencies),
+        "delete_ms": (time.perf_counter() - delete_start) * 1000,
+    }
+
+
+async def _upload(client: httpx.AsyncClient, path: str) -> str:
+    """Upload a PDF and wait until ingestion finishes"""
+    with open(path, "rb") as f:
+        response = await client.post("/api/upload", files={"file": (os.path.basename(path), f, "application/pdf")})
+    response.raise_for_status()
+    document_id = response.json()["document_id"]
+    while True:
+        status = (await client.get(f"/api/documents/{document_id}/status")).json()["status"]
+        if status == "processed":
+            return document_id
+        if status == "failed":
+            raise RuntimeError(f"Ingestion of {path} failed")
+        await asyncio.sleep(0.05)
+
+
+async def bench_chat(client: httpx.AsyncClient, document_id: str, concurrency_levels: List[int],
+                     requests_per_level: int) -> Dict[str, Any]:
+    """p50/p99 latency and QPS for /api/chat at fixed concurrency levels"""
+    questions = [
+        template.format(year=2015 + i % 9) + f" ({i})"
+        for i, template in enumerate(QUESTIONS * (requests_per_level // len(QUESTIONS) + 1))
+    ][:requests_per_level]
+
+    async def ask(question: str) -> float:
+        start = time.perf_counter()
+        response = await client.post("/api/chat", json={"question": question, "document_id": document_id})
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    results: Dict[str, Any] = {}
+    for level in concurrency_levels:
+        await asyncio.gather(*(ask(question) for question in questions[:level]))
+        semaphore = asyncio.Semaphore(level)
+
+        async def bounded(question: str) -> float:
+            async with semaphore:
+                return await ask(question)
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(bounded(question) for question in questions))
+        elapsed = time.perf_counter() - start
+        results[f"concurrency_{level}"] = dict(
+            _percentiles(latencies), requests=len(latencies), qps=len(latencies) / elapsed,
+        )
+    return results
+
+
+async def bench_corpus(client: httpx.AsyncClient, sizes: List[int], pages: int) -> List[Dict[str, Any]]:
+    """/api/documents listing and delete latency as the corpus grows"""
+    results = []
+    seed = 1000
+    uploaded = 0
+    for size in sizes:
+        while uploaded < size:
+            await _upload(client, make_pdf(os.path.join(BENCH_DIR, f"corpus-{seed}.pdf"), pages, seed))
+            seed += 1
+            uploaded += 1
+        latencies = []
+        for _ in range(20):
+            start = time.perf_counter()
+            (await client.get("/api/documents")).raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        extra = await _upload(client, make_pdf(os.path.join(BENCH_DIR, f"corpus-{seed}.pdf"), pages, seed))
+        seed += 1
+        start = time.perf_counter()
+        (await client.delete(f"/api/documents/{extra}")).raise_for_status()
+        delete_ms = (time.perf_counter() - start) * 1000
+        results.append({
+            "documents": size,
+            "list_p50_ms": _percentiles(latencies)["p50_ms"],
+            "list_p99_ms": _percentiles(latencies)["p99_ms"],
+            "delete_ms": delete_ms,
+        })
+    return results
+
+
+async def bench_api(chat_pdf: str, concurrency_levels: List[int], requests_per_level: int,
+                    corpus_sizes: List[int], corpus_pages: int) -> Dict[str, Any]:
+    import main as server
+
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            start = time.perf_counter()
+            document_id = await _upload(client, chat_pdf)
+            ingest_seconds = time.perf_counter() - start
+            chat = await bench_chat(client, document_id, concurrency_levels, requests_per_level)
+            corpus = await bench_corpus(client, corpus_sizes, corpus_pages)
+    finally:
+        await server.shutdown_event()
+    return {"ingest": {"pdf": os.path.basename(chat_pdf), "seconds": ingest_seconds}, "chat": chat, "corpus": corpus}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(results: Any, prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            flat.update(_flatten(value, f"{prefix}{key}."))
+    elif isinstance(results, list):
+        for item in results:
+            label = item.get("documents", "") if isinstance(item, dict) else ""
+            flat.update(_flatten(item, f"{prefix}{label}."))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        flat[prefix.rstrip(".")] = float(results)
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return the throughput (*_per_sec, qps) and latency (*_ms) metrics that got worse by more than tolerance"""
+    now, before = _flatten(current["results"]), _flatten(baseline["results"])
+    regressions = []
+    for key, value in now.items():
+        old = before.get(key)
+        if not old:
+            continue
+        if key.endswith(("_per_sec", ".qps")) and value < old * (1 - tolerance):
+            regressions.append(f"{key}: {old:.2f} -> {value:.2f}")
+        elif key.endswith("_ms") and value > old * (1 + tolerance):
+            regressions.append(f"{key}: {old:.2f} -> {value:.2f}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results",
+                                                         f"{datetime.now():%Y%m%d-%H%M%S}.json"))
+    parser.add_argument("--synthetic-pages", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64, help="chat requests per concurrency level")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--corpus-pages", type=int, default=10)
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    parser.add_argument("--keep", action="store_true", help=f"keep the working directory ({BENCH_DIR})")
+    args = parser.parse_args()
+
+    try:
+        pdfs = {"sample": SAMPLE_PDF}
+        for pages in args.synthetic_pages:
+            pdfs[f"synthetic_{pages}"] = make_pdf(os.path.join(BENCH_DIR, f"synthetic-{pages}.pdf"), pages, seed=pages)
+
+        import main as server
+        extraction, chunks = bench_extraction(pdfs)
+        add_documents = bench_add_documents(server.get_services().vector_store, chunks)
+        api = asyncio.run(bench_api(
+            pdfs[f"synthetic_{min(args.synthetic_pages)}"], args.concurrency, args.requests,
+            args.corpus_sizes, args.corpus_pages,
+        ))
+    finally:
+        if not args.keep:
+            shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {
+                name: getattr(settings, name)
+                for name in ("vector_db_type", "pdf_backend", "chunk_size", "chunk_overlap", "retrieval_k",
+                             "embedding_batch_size", "ingest_extract_workers", "rag_io_workers", "hybrid_retrieval")
+            },
+        },
+        "results": {"extraction": extraction, "add_documents": add_documents, **api},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import random
+from typing import List
+
+import fitz  # PyMuPDF
+
+_COMPANIES = ["Northwind Holdings", "Contoso Semiconductor", "Fabrikam Energy", "Tailspin Logistics", "Litware Bank"]
+_LINE_ITEMS = [
+    "Revenue", "Cost of sales", "Gross profit", "Selling and administrative expenses", "Operating income",
+    "Finance income", "Finance costs", "Income before tax", "Income tax expense", "Net income",
+    "Total assets", "Total liabilities", "Cash and cash equivalents", "Inventories", "Trade receivables",
+]
+_WORDS = (
+    "the company reported growth in demand across segments while margins were affected by pricing pressure "
+    "capital expenditure increased as new capacity came online and working capital improved through lower "
+    "inventory levels management expects market conditions to stabilize next year subject to macroeconomic risk "
+    "the board approved a dividend and continued the share buyback programme debt was refinanced at lower rates"
+).split()
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _table(rng: random.Random, years: List[int]) -> str:
+    lines = ["(KRW million)".ljust(40) + "".join(str(year).rjust(16) for year in years)]
+    for item in _LINE_ITEMS:
+        figures = "".join(f"{rng.randint(1_000, 9_999_999):,}".rjust(16) for _ in years)
+        lines.append(item.ljust(40) + figures)
+    return "\n".join(lines)
+
+
+def make_pdf(path: str, pages: int, seed: int = 0) -> str:
+    """
+    Write a deterministic financial-report-like PDF of `pages` pages:
+    narrative paragraphs plus a figure table on every page.
+    """
+    rng = random.Random(seed)
+    company = _COMPANIES[seed % len(_COMPANIES)]
+    with fitz.open() as pdf:
+        for page_num in range(1, pages + 1):
+            page = pdf.new_page(width=595, height=842)
+            year = 2015 + rng.randint(0, 8)
+            text = "\n\n".join([
+                f"{company} annual report {year} - section {page_num}",
+                _paragraph(rng, 110),
+                _table(rng, [year - 2, year - 1, year]),
+                _paragraph(rng, 90),
+                _paragraph(rng, 70),
+            ])
+            page.insert_textbox(fitz.Rect(40, 40, 555, 802), text, fontsize=8, fontname="cour")
+        pdf.save(path)
+    return path
@@ -13,24 +13,111 @@ class Settings(BaseSettings):
     vector_db_type: str = os.getenv("VECTOR_DB_TYPE", "chromadb")
     chroma_persist_dir: str = "./chroma_db"
     
+    # FAISS engine configuration (VECTOR_DB_TYPE=faiss): "flat", "ivf" or "hnsw"
+    faiss_index_type: str = os.getenv("FAISS_INDEX_TYPE", "flat")
+    faiss_nlist: int = int(os.getenv("FAISS_NLIST", "1024"))
+    faiss_nprobe: int = int(os.getenv("FAISS_NPROBE", "16"))
+    faiss_hnsw_m: int = int(os.getenv("FAISS_HNSW_M", "32"))
+    faiss_ef_search: int = int(os.getenv("FAISS_EF_SEARCH", "64"))
+    faiss_mmap: bool = os.getenv("FAISS_MMAP", "True").lower() == "true"
+    faiss_persist_every: int = int(os.getenv("FAISS_PERSIST_EVERY", "5000"))
+    
     # PDF upload path
     pdf_upload_path: str = os.getenv("PDF_UPLOAD_PATH", "../data")
+    # Cache-Control for served PDFs; responses carry a content-hash ETag, so
+    # "no-cache" revalidates with a cheap 304 instead of re-downloading
+    pdf_cache_control: str = os.getenv("PDF_CACHE_CONTROL", "private, no-cache")
+    
+    # Document registry (document metadata and chunk ids)
+    document_registry_path: str = os.getenv("DOCUMENT_REGISTRY_PATH", "./document_registry.sqlite3")
     
-    # Embedding model configuration
-    embedding_model: str = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    # Embedding model configuration ("cohere", "local" sentence-transformers or
+    # "hash", a deterministic offline embedder for benchmarks)
+    # An empty model name uses the backend's default model
+    embedding_backend: str = os.getenv("EMBEDDING_BACKEND", "cohere")
+    embedding_model: str = os.getenv("EMBEDDING_MODEL", "")
+    embedding_threads: int = int(os.getenv("EMBEDDING_THREADS", "0"))
+    embedding_device: str = os.getenv("EMBEDDING_DEVICE", "cpu")
     
-    # LLM configuration
+    # Embedding cache configuration
+    embedding_cache_enabled: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+    embedding_cache_path: str = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache/embeddings.sqlite3")
+    embedding_cache_max_entries: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+    embedding_cache_memory_entries: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000"))
+    embedding_cache_float16: bool = os.getenv("EMBEDDING_CACHE_FLOAT16", "False").lower() == "true"
+    
+    # LLM configuration ("cohere" or "fake" for a deterministic local generator)
+    llm_backend: str = os.getenv("LLM_BACKEND", "cohere")
     llm_model: str = os.getenv("LLM_MODEL", "command-r-plus")
     llm_temperature: float = float(os.getenv("LLM_TEMPERATURE", "0.1"))
     max_tokens: int = int(os.getenv("MAX_TOKENS", "1000"))
     
+    # Context configuration: the context gets what the model window leaves after the
+    # prompt and MAX_TOKENS, capped at CONTEXT_MAX_TOKENS
+    llm_context_window: int = int(os.getenv("LLM_CONTEXT_WINDOW", "4096"))
+    context_max_tokens: int = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+    context_tokenizer: str = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+    context_mmr_lambda: float = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+    # Neighbouring chunks are merged only on an overlap of at least this many characters
+    context_min_stitch_chars: int = int(os.getenv("CONTEXT_MIN_STITCH_CHARS", "30"))
+    
+    # Chat history configuration: the last HISTORY_RECENT_TURNS turns are sent verbatim,
+    # older ones as a rolling summary cached per conversation_id. Aged-out turns are
+    # summarized HISTORY_SUMMARY_BLOCK at a time in the background, off the request path
+    history_compaction: bool = os.getenv("HISTORY_COMPACTION", "True").lower() == "true"
+    history_recent_turns: int = int(os.getenv("HISTORY_RECENT_TURNS", "4"))
+    history_summary_tokens: int = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+    history_turn_tokens: int = int(os.getenv("HISTORY_TURN_TOKENS", "400"))
+    history_summary_block: int = int(os.getenv("HISTORY_SUMMARY_BLOCK", "4"))
+    history_query_rewrite: bool = os.getenv("HISTORY_QUERY_REWRITE", "True").lower() == "true"
+    conversation_store_path: str = os.getenv("CONVERSATION_STORE_PATH", "./conversations.sqlite3")
+    
     # Chunking configuration
     chunk_size: int = int(os.getenv("CHUNK_SIZE", "1000"))
     chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+    # Extracted page text is kept here so documents can be re-chunked without parsing the PDF
+    page_store_path: str = os.getenv("PAGE_STORE_PATH", "./page_store.sqlite3")
+    
+    # PDF extraction configuration ("pymupdf" or "pdfplumber")
+    pdf_backend: str = os.getenv("PDF_BACKEND", "pymupdf")
+    pdf_pages_per_task: int = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+    
+    # Table extraction: pages with at least `table_min_figures` figures and ruling lines are
+    # scanned for tables. Off by default: detection costs ~0.4s per table page
+    table_extraction: bool = os.getenv("TABLE_EXTRACTION", "False").lower() == "true"
+    table_min_figures: int = int(os.getenv("TABLE_MIN_FIGURES", "20"))
+    table_store_path: str = os.getenv("TABLE_STORE_PATH", "./table_store")
+    
+    # Ingestion worker configuration
+    ingest_workers: int = int(os.getenv("INGEST_WORKERS", "2"))
+    ingest_extract_workers: int = int(os.getenv("INGEST_EXTRACT_WORKERS", "2"))
+    upload_chunk_bytes: int = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+    embedding_batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
     
     # Retrieval configuration
     retrieval_k: int = int(os.getenv("RETRIEVAL_K", "2"))
-    similarity_threshold: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.7"))
+    # Minimum cosine similarity of a dense hit; every vector engine reports this scale
+    similarity_threshold: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.2"))
+    
+    # Hybrid retrieval configuration
+    hybrid_retrieval: bool = os.getenv("HYBRID_RETRIEVAL", "True").lower() == "true"
+    lexical_index_path: str = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index.sqlite3")
+    lexical_k: int = int(os.getenv("LEXICAL_K", "5"))
+    rrf_k: int = int(os.getenv("RRF_K", "60"))
+    # Chunks scored per query term, highest term frequency first
+    lexical_max_postings: int = int(os.getenv("LEXICAL_MAX_POSTINGS", "1000"))
+    
+    # Request path configuration
+    rag_io_workers: int = int(os.getenv("RAG_IO_WORKERS", "8"))
+    chat_timeout: float = float(os.getenv("CHAT_TIMEOUT", "60"))
+    batch_max_questions: int = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+    batch_llm_concurrency: int = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+    
+    # Answer cache configuration
+    answer_cache_enabled: bool = os.getenv("ANSWER_CACHE_ENABLED", "True").lower() == "true"
+    answer_cache_max_entries: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+    answer_cache_ttl: float = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+    answer_cache_similarity: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
     
     # Server configuration
     host: str = os.getenv("HOST", "0.0.0.0")
@@ -46,6 +133,14 @@ class Settings(BaseSettings):
     # Logging configuration
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
     
+    # Metrics configuration: stage and request latency histograms on /metrics
+    metrics_enabled: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+
+    # Startup warm-up configuration
+    warmup_on_startup: bool = os.getenv("WARMUP_ON_STARTUP", "True").lower() == "true"
+    # "auto" warms up in-process embedders only; "true" also sends one billed request to Cohere
+    warmup_embed: str = os.getenv("WARMUP_EMBED", "auto").lower()
+    
     class Config:
         env_file = ".env"
 
@@ -1,17 +1,20 @@
+import asyncio
+import hashlib
+import json
 import logging
 import time
 import os
 import re
 import uuid
-from datetime import datetime
+from typing import Any, Awaitable, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Path
+from fastapi import FastAPI, UploadFile, File, HTTPException, Path, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from models.schemas import ChatRequest, ChatResponse, DocumentsResponse, UploadResponse
-from services.pdf_processor import PDFProcessor
-from services.vector_store import VectorStoreService
-from services.rag_pipeline import RAGPipeline
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from models.schemas import BatchChatRequest, ChatRequest, ChatResponse, ChunkInfo, ChunksResponse, DocumentsResponse, DocumentStatusResponse, ReindexResponse, UploadResponse
+from services.container import ServiceContainer, create_services
+from services.file_response import RangeFileResponse
+from services.metrics import MetricsMiddleware, metrics, request_timings, span
 from config import settings
 
 
@@ -33,19 +36,35 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
 
-# Initialize services
-# TODO: Initialize your services here
-pdf_processor = None
-vector_store = None
-rag_pipeline = RAGPipeline()
+# Application-scoped services, created on startup and shared by all endpoints
+service_container: Optional[ServiceContainer] = None
+
+
+def get_services() -> ServiceContainer:
+    """Return the shared service container, creating it if startup has not run"""
+    global service_container
+    if service_container is None:
+        service_container = create_services()
+    return service_container
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
-    # TODO: Initialize your services
     logger.info("Starting RAG Q&A System...")
+    get_services()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared services on shutdown"""
+    global service_container
+    if service_container is not None:
+        await service_container.aclose()
+        service_container = None
 
 
 @app.get("/")
@@ -54,13 +73,30 @@ async def root():
     return {"message": "RAG-based Financial Statement Q&A System is running"}
 
 
-@app.post("/api/upload")
-async def upload_pdf(file: UploadFile = File(...)):
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage and request latency histograms in the Prometheus text format"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/api/upload", response_model=UploadResponse)
+async def upload_pdf(file: UploadFile = File(...), include_timings: bool = Query(False)):
     # 1. Validate file type
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
+    with request_timings() as timings:
+        response = await _store_upload(file)
+    if include_timings:
+        response.timings = timings
+    return response
+
 
-    # 2. Save uploaded file
+async def _store_upload(file: UploadFile) -> UploadResponse:
+
+    # 2. Save uploaded file, hashing it as it streams to disk
+    start_time = time.time()
     document_id = str(uuid.uuid4())
     original_filename = file.filename
     sanitized_filename = re.sub(r"\s+", "-", original_filename)
@@ -68,35 +104,80 @@ async def upload_pdf(file: UploadFile = File(...)):
     pdf_upload_path = getattr(settings, "pdf_upload_path")
     os.makedirs(pdf_upload_path, exist_ok=True)
     file_path = os.path.join(pdf_upload_path, unique_filename)
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
-
-    # 3. Extract text from PDF
-    pdf_processor = PDFProcessor()
-    start_time = time.time()
-    pages_content = pdf_processor.extract_text_from_pdf(file_path)
-
-    # 4. Split text into chunks
-    documents = pdf_processor.split_into_chunks(pages_content, document_id, unique_filename)
+    partial_path = f"{file_path}.part"
+    chunk_bytes = getattr(settings, "upload_chunk_bytes", 1024 * 1024)
+    sha256 = hashlib.sha256()
+    with span("upload_save"), open(partial_path, "wb") as f:
+        while chunk := await file.read(chunk_bytes):
+            sha256.update(chunk)
+            f.write(chunk)
+    content_hash = sha256.hexdigest()
+
+    # 3. Return the existing document if this exact file was already ingested
+    content_index = get_services().content_index
+    existing = content_index.lookup(content_hash)
+    if existing is not None:
+        status = _get_document_status(existing["document_id"])
+        if status is not None and status.status != "failed":
+            os.remove(partial_path)
+            logger.info(f"Duplicate upload of document {status.document_id}.")
+            return UploadResponse(
+                message="Document was already uploaded.",
+                filename=status.filename,
+                chunks_count=status.chunks_embedded,
+                processing_time=time.time() - start_time,
+                document_id=status.document_id,
+                status=status.status,
+                cache_hit=True
+            )
+        content_index.remove_document(existing["document_id"])
+    os.replace(partial_path, file_path)
+    content_index.add(content_hash, document_id, unique_filename)
+
+    # 4. Queue extraction, chunking and embedding in the background
+    with span("ingest_submit"):
+        job = get_services().ingestion.submit(document_id, file_path, unique_filename)
     processing_time = time.time() - start_time
 
-    # 5. (Optional) Store documents in vector database (not implemented here)
-    vector_store = VectorStoreService()
-    vector_store.add_documents(documents)
-
-    # 6. Return response
+    # 5. Return response
     return UploadResponse(
-        message="Upload and processing successful.",
+        message="Upload successful. Processing has been queued.",
         filename=unique_filename,
-        chunks_count=len(documents),
+        chunks_count=0,
         processing_time=processing_time,
-        document_id=document_id
+        document_id=document_id,
+        status=job["status"]
     )
 
 
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before the response is ready"""
+
+
+async def _until_disconnect(raw_request: Request, coro: Awaitable[Any]) -> Any:
+    """
+    Await `coro`, cancelling it if the client disconnects first.
+    The request body has already been read, so the next ASGI message is the disconnect.
+    """
+    task = asyncio.ensure_future(coro)
+
+    async def wait_for_disconnect():
+        while (await raw_request.receive())["type"] != "http.disconnect":
+            pass
+
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        raise ClientDisconnected()
+    return task.result()
+
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, raw_request: Request):
     """
     Process chat request and return AI response using RAG pipeline.
     """
@@ -104,104 +185,196 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
     try:
-        result = rag_pipeline.generate_answer(
-            question=request.question,
-            chat_history=request.chat_history or [],
-            document_id=request.document_id 
-        )
-        return ChatResponse(
-            answer=result["answer"],
-            sources=result["sources"],
-            processing_time=result["processing_time"]
-        )
+        with request_timings() as timings:
+            result = await _until_disconnect(raw_request, get_services().rag_pipeline.agenerate_answer(
+                question=request.question,
+                chat_history=request.chat_history or [],
+                document_id=request.document_id,
+                conversation_id=request.conversation_id,
+            ))
+    except ClientDisconnected:
+        logger.info("Client disconnected; chat request cancelled.")
+        return Response(status_code=499)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out generating answer.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating answer: {str(e)}")
+    return ChatResponse(
+        answer=result["answer"],
+        sources=result["sources"],
+        processing_time=result["processing_time"],
+        cache_hit=result.get("cache_hit"),
+        cache_similarity=result.get("cache_similarity"),
+        structured_answer=result.get("structured_answer", False),
+        timings=timings if request.include_timings else None,
+    )
+
 
+def _sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Stream a RAG answer as Server-Sent Events: sources, answer tokens, then timings.
+    """
+    if not request.question or not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    events = get_services().rag_pipeline.astream_answer(
+        question=request.question,
+        chat_history=request.chat_history or [],
+        document_id=request.document_id,
+        conversation_id=request.conversation_id,
+    )
 
+    async def event_stream():
+        # Starlette cancels this generator when the client disconnects
+        with request_timings() as timings:
+            try:
+                async for event in events:
+                    if event["event"] == "done" and request.include_timings:
+                        event["data"]["stages"] = dict(timings)
+                    yield _sse(event["event"], event["data"])
+            except asyncio.TimeoutError:
+                yield _sse("error", {"message": "Timed out generating answer."})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """
+    Answer a list of questions against one or more documents, streamed as NDJSON.
+    Each retrieved chunk is sent once as a "chunk" line; "result" lines reference
+    chunks by chunk_id and arrive in completion order, tagged with their index.
+    """
+    questions = [question.strip() for question in request.questions]
+    if not questions or not all(questions):
+        raise HTTPException(status_code=400, detail="Questions cannot be empty.")
+    targets = len(request.document_ids) if request.document_ids else 1
+    if len(questions) * targets > settings.batch_max_questions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can contain at most {settings.batch_max_questions} question/document pairs.",
+        )
+
+    events = get_services().rag_pipeline.abatch_answer(questions, request.document_ids)
+
+    async def ndjson_stream():
+        # Starlette cancels this generator, and with it pending answers, when the client disconnects
+        async for event in events:
+            yield json.dumps({"type": event["event"], **event["data"]}, default=str) + "\n"
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
+# Handlers that call Chroma or SQLite directly are plain functions, so FastAPI
+# runs them on its threadpool instead of blocking the event loop
 @app.get("/api/documents", response_model=DocumentsResponse)
-async def get_documents():
-    vector_store = VectorStoreService()
-    collection = vector_store.vector_store._collection
-    metadatas = collection.get(include=["metadatas"]).get("metadatas", [])
-    all_metadatas = [m for sublist in metadatas for m in (sublist if isinstance(sublist, list) else [sublist]) if m]
-    doc_info = {}
-    for meta in all_metadatas:
-        doc_id = meta.get("document_id")
-        if not doc_id:
-            continue
-        if doc_id not in doc_info:
-            # Try to parse or fallback to now
-            uploaded_at = meta.get("uploaded_at")
-            if uploaded_at is None:
-                upload_date = datetime.utcnow()
-            elif isinstance(uploaded_at, datetime):
-                upload_date = uploaded_at
-            else:
-                try:
-                    upload_date = datetime.fromisoformat(uploaded_at)
-                except Exception:
-                    upload_date = datetime.utcnow()
-            doc_info[doc_id] = {
-                "document_id": doc_id,
-                "filename": meta.get("filename", ""),
-                "upload_date": upload_date,
-                "chunks_count": 0,
-                "status": meta.get("status", "processed"),
-            }
-        doc_info[doc_id]["chunks_count"] += 1
-
-    documents = list(doc_info.values())
+def get_documents():
+    documents = [
+        {
+            "document_id": record["document_id"],
+            "filename": record["filename"],
+            "upload_date": record["uploaded_at"],
+            "chunks_count": record["chunk_count"],
+            "status": record["status"],
+        }
+        for record in get_services().registry.list_documents()
+    ]
     return DocumentsResponse(documents=documents)
 
 
-@app.get("/api/document/{document_id}")
-async def get_document_pdf(document_id: str):
+def _get_document_status(document_id: str) -> Optional[DocumentStatusResponse]:
+    """Look up ingestion state for a document, or None if it is unknown"""
+    job = get_services().ingestion.get_status(document_id)
+    if job is not None:
+        return DocumentStatusResponse(**job)
+
+    # Finished documents from earlier runs only exist in the registry
+    record = get_services().registry.get(document_id)
+    if record is None:
+        return None
+    return DocumentStatusResponse(
+        document_id=document_id,
+        filename=record["filename"],
+        status=record["status"],
+        pages_total=record["pages_total"],
+        pages_done=record["pages_total"] if record["status"] == "processed" else 0,
+        chunks_total=record["chunk_count"],
+        chunks_embedded=record["chunk_count"],
+        error=record["error"],
+    )
+
+
+@app.get("/api/documents/{document_id}/status", response_model=DocumentStatusResponse)
+def get_document_status(document_id: str):
+    """
+    Report ingestion progress for a document.
+    """
+    status = _get_document_status(document_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return status
+
+
+@app.api_route("/api/document/{document_id}", methods=["GET", "HEAD"])
+async def get_document_pdf(document_id: str, request: Request):
     """
     Serve the PDF file for a given document_id.
+    Supports byte ranges, so viewers can fetch pages lazily, and conditional
+    requests against an ETag derived from the file's content hash.
     """
-    vector_store = VectorStoreService()
-    collection = vector_store.vector_store._collection
-    metadatas = collection.get(include=["metadatas"]).get("metadatas", [])
-    all_metadatas = [m for sublist in metadatas for m in (sublist if isinstance(sublist, list) else [sublist]) if m]
-    # Find the first chunk with this document_id to get the filename
-    for meta in all_metadatas:
-        if meta.get("document_id") == document_id:
-            filename = meta.get("filename")
-            break
-    else:
+    services = get_services()
+    record = services.registry.get(document_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Document not found")
+    filename = record["filename"]
     pdf_upload_path = getattr(settings, "pdf_upload_path", "uploaded_files")
     file_path = os.path.join(pdf_upload_path, filename)
-    if not os.path.exists(file_path):
+    try:
+        stat_result = os.stat(file_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
+    content_hash = services.content_index.get_hash(document_id)
+    # Files uploaded before hashing was added fall back to a weak validator
+    etag = f'"{content_hash}"' if content_hash else f'W/"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
     headers = {
         "Content-Disposition": f'inline; filename="{filename}"',
-        "Cache-Control": "no-store",
+        "Cache-Control": settings.pdf_cache_control,
         "X-Content-Type-Options": "nosniff",
         # Optionally, restrict framing or scripts:
         # "Content-Security-Policy": "frame-ancestors 'self';"
     }
-    return FileResponse(file_path, media_type="application/pdf", filename=filename, headers=headers)
+    return RangeFileResponse(file_path, request.headers, etag, media_type="application/pdf", headers=headers,
+                             method=request.method, stat_result=stat_result)
 
 
 @app.delete("/api/documents/{document_id}")
-async def delete_document(document_id: str = Path(..., description="The document_id to delete")):
-    vector_store = VectorStoreService()
-    collection = vector_store.vector_store._collection
-    result = collection.get(include=["metadatas"])
-    ids = result.get("ids", [])
-    metadatas = result.get("metadatas", [])
-    ids_to_delete = []
-    filename = None
-    for idx, meta in enumerate(metadatas):
-        if meta and meta.get("document_id") == document_id:
-            ids_to_delete.append(ids[idx])
-            if not filename:
-                filename = meta.get("filename")
-    if not ids_to_delete:
+def delete_document(document_id: str = Path(..., description="The document_id to delete")):
+    services = get_services()
+    record = services.registry.delete(document_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Document not found")
-
-    vector_store.delete_documents(ids_to_delete)
+    filename = record["filename"]
+
+    services.ingestion.forget(document_id)
+    services.vector_store.delete_by_document_id(document_id)
+    services.content_index.remove_document(document_id)
+    if services.lexical_index is not None:
+        services.lexical_index.remove_document(document_id)
+    if services.table_store is not None:
+        services.table_store.remove(document_id)
+    services.page_store.remove(document_id)
+    if services.answer_cache is not None:
+        services.answer_cache.invalidate(document_id)
 
     pdf_upload_path = getattr(settings, "pdf_upload_path", "uploaded_files")
     if filename:
@@ -212,12 +385,68 @@ async def delete_document(document_id: str = Path(..., description="The document
     return {"message": f"Document {document_id} and its chunks deleted successfully."}
 
 
-@app.get("/api/chunks")
-async def get_chunks():
-    """Get document chunks (optional endpoint)"""
-    # TODO: Implement chunk listing
-    # - Return document chunks with metadata
-    pass
+@app.post("/api/documents/reindex", response_model=ReindexResponse)
+def reindex_documents(force: bool = Query(False, description="Reindex even if chunking settings are unchanged")):
+    """
+    Re-chunk every processed document with the current CHUNK_SIZE/CHUNK_OVERLAP.
+    Only chunks whose text changed are embedded again; progress is reported
+    by the status endpoint.
+    """
+    services = get_services()
+    queued, skipped = [], []
+    for record in services.registry.list_documents():
+        document_id = record["document_id"]
+        (queued if services.ingestion.submit_reindex(document_id, force) else skipped).append(document_id)
+    return ReindexResponse(queued=queued, skipped=skipped)
+
+
+@app.post("/api/documents/{document_id}/reindex", response_model=ReindexResponse)
+def reindex_document(document_id: str, force: bool = Query(False)):
+    """
+    Re-chunk one document with the current chunking settings.
+    """
+    services = get_services()
+    if services.registry.get(document_id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if services.ingestion.submit_reindex(document_id, force):
+        return ReindexResponse(queued=[document_id], skipped=[])
+    return ReindexResponse(queued=[], skipped=[document_id])
+
+
+@app.get("/api/chunks", response_model=ChunksResponse)
+def get_chunks(
+    document_id: Optional[str] = Query(None, description="Only return chunks of this document"),
+    page_from: Optional[int] = Query(None, ge=1, description="First page (inclusive)"),
+    page_to: Optional[int] = Query(None, ge=1, description="Last page (inclusive)"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, description="Page size; defaults to 100 for JSON, unlimited for NDJSON"),
+    include_content: bool = Query(True, description="Set to false to return metadata only"),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """
+    Get document chunks with metadata, paginated by offset.
+    format=ndjson streams every matching chunk from `offset` as one JSON object per line.
+    """
+    vector_store = get_services().vector_store
+    if format == "ndjson":
+        chunks = vector_store.iter_chunks(document_id, page_from, page_to, offset, limit, include_content)
+        lines = (ChunkInfo(**chunk).model_dump_json() + "\n" for chunk in chunks)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    limit = min(limit or 100, 1000)
+    chunks = vector_store.get_chunks(document_id, page_from, page_to, offset, limit, include_content)
+    if document_id and page_from is None and page_to is None:
+        record = get_services().registry.get(document_id)
+        total_count = record["chunk_count"] if record else 0
+    else:
+        total_count = vector_store.count_chunks(document_id, page_from, page_to)
+    next_offset = offset + len(chunks)
+    return ChunksResponse(
+        chunks=chunks,
+        total_count=total_count,
+        offset=offset,
+        next_offset=next_offset if next_offset < total_count else None,
+    )
 
 
 if __name__ == "__main__":
@@ -7,12 +7,22 @@ class ChatRequest(BaseModel):
     question: str
     chat_history: Optional[List[Dict[str, str]]] = []
     document_id: Optional[str] = None
+    # Lets the server reuse the summary of older turns across requests
+    conversation_id: Optional[str] = None
+    # Return the per-stage timing breakdown in the response
+    include_timings: bool = False
+
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    document_ids: Optional[List[str]] = None
 
 
 class DocumentSource(BaseModel):
     content: str
     page: int
-    score: float
+    # Cosine similarity of the dense hit; None for chunks only keyword search found
+    score: Optional[float] = None
     metadata: Optional[Dict[str, Any]] = {}
 
 
@@ -20,6 +30,10 @@ class ChatResponse(BaseModel):
     answer: str
     sources: List[DocumentSource]
     processing_time: float
+    cache_hit: Optional[str] = None
+    cache_similarity: Optional[float] = None
+    structured_answer: bool = False
+    timings: Optional[Dict[str, float]] = None
 
 
 class DocumentInfo(BaseModel):
@@ -40,15 +54,36 @@ class UploadResponse(BaseModel):
     filename: str
     chunks_count: int
     processing_time: float
+    status: Optional[str] = None
+    cache_hit: bool = False
+    timings: Optional[Dict[str, float]] = None
+
+
+class DocumentStatusResponse(BaseModel):
+    document_id: str
+    filename: str
+    status: str
+    pages_total: int = 0
+    pages_done: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    error: Optional[str] = None
+
+
+class ReindexResponse(BaseModel):
+    queued: List[str]
+    skipped: List[str]
 
 
 class ChunkInfo(BaseModel):
     id: str
-    content: str
+    content: Optional[str] = None
     page: int
     metadata: Dict[str, Any]
 
 
 class ChunksResponse(BaseModel):
     chunks: List[ChunkInfo]
-    total_count: int 
\ No newline at end of file
+    total_count: int
+    offset: int = 0
+    next_offset: Optional[int] = None 
\ No newline at end of file
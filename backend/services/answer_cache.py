@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_HIT_EXACT = "exact"
+CACHE_HIT_SEMANTIC = "semantic"
+
+# Digits inside words count too, so "FY2023" and "Q3" carry their figures
+_FIGURE_RE = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r"[\s?!.]+$", "", " ".join(question.lower().split()))
+
+
+def question_figures(question: str) -> frozenset:
+    """Numbers and years in a question, with thousands separators dropped"""
+    return frozenset(figure.replace(",", "") for figure in _FIGURE_RE.findall(normalize_question(question)))
+
+
+def history_key(chat_history: Optional[List[Dict[str, str]]]) -> str:
+    """Stable digest of the conversation so far"""
+    if not chat_history:
+        return ""
+    payload = json.dumps(chat_history, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Two-level cache of generated answers.
+    Level one matches the normalized question, document_id and chat history
+    exactly; level two matches the question embedding against earlier questions
+    for the same document and history above `similarity_cutoff`. Questions
+    that differ only in a year or figure embed almost identically, so level
+    two also requires the same numbers and years in both questions.
+    Entries expire after `ttl` seconds and the least recently used are evicted.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, similarity_cutoff: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_cutoff = similarity_cutoff
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(question: str, document_id: Optional[str], chat_history: Optional[List[Dict[str, str]]]) -> str:
+        return f"{document_id or '*'}|{history_key(chat_history)}|{normalize_question(question)}"
+
+    def get_exact(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for an exact key, if present and fresh"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry["result"]
+
+    def get_semantic(self, question: str, embedding: List[float], document_id: Optional[str],
+                     chat_history: Optional[List[Dict[str, str]]]) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Return the closest cached result above the cutoff and its cosine similarity"""
+        query = _unit(embedding)
+        history = history_key(chat_history)
+        figures = question_figures(question)
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry["document_id"] == document_id and entry["history"] == history
+                and entry["figures"] == figures
+                and entry["embedding"] is not None and not self._expired(entry)
+            ]
+            if not candidates:
+                self.misses += 1
+                return None
+            matrix = np.stack([entry["embedding"] for _, entry in candidates])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.similarity_cutoff:
+                self.misses += 1
+                return None
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return entry["result"], similarity
+
+    def put(self, key: str, result: Dict[str, Any], document_id: Optional[str],
+            chat_history: Optional[List[Dict[str, str]]], embedding: Optional[List[float]] = None,
+            question: str = "") -> None:
+        """Store a result; `question` is the text `embedding` was computed from"""
+        with self._lock:
+            self._entries[key] = {
+                "result": result,
+                "document_id": document_id,
+                "history": history_key(chat_history),
+                "embedding": _unit(embedding) if embedding is not None else None,
+                "figures": question_figures(question),
+                "created_at": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, document_id: Optional[str] = None) -> None:
+        """
+        Drop answers that may depend on a document that changed.
+        Answers for a specific document and answers across all documents are removed.
+        """
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry["document_id"] is None or document_id is None or entry["document_id"] == document_id
+            ]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached answers for document {document_id}.")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["created_at"] > self.ttl
+
+
+def _unit(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,158 @@
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.schema import Document
+
+from services.pdf_processor import PDFProcessor
+from services.vector_store import create_vector_store
+from services.rag_pipeline import AsyncRAGPipeline
+from services.answer_cache import AnswerCache
+from services.lexical_index import LexicalIndex
+from services.table_store import TableStore
+from services.conversation_store import ConversationStore
+from services.page_store import PageStore
+from services.ingestion import IngestionQueue
+from services.content_index import ContentIndex
+from services.document_registry import DocumentRegistry
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    Application-scoped holder for the services shared by every endpoint.
+    The Chroma client, embedding client and text splitter are created once
+    here instead of on every request.
+    """
+
+    def __init__(self):
+        self.pdf_processor = PDFProcessor(chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap)
+        self.vector_store = create_vector_store()
+        self.embeddings = self.vector_store.base_embeddings
+        self.answer_cache = AnswerCache(
+            max_entries=settings.answer_cache_max_entries,
+            ttl=settings.answer_cache_ttl,
+            similarity_cutoff=settings.answer_cache_similarity,
+        ) if settings.answer_cache_enabled else None
+        self.lexical_index = LexicalIndex(settings.lexical_index_path, max_postings=settings.lexical_max_postings) if settings.hybrid_retrieval else None
+        self.table_store = TableStore(settings.table_store_path) if settings.table_extraction else None
+        self.conversation_store = ConversationStore(settings.conversation_store_path) if settings.history_compaction else None
+        self.rag_pipeline = AsyncRAGPipeline(
+            vector_store=self.vector_store,
+            answer_cache=self.answer_cache,
+            lexical_index=self.lexical_index,
+            table_store=self.table_store,
+            conversation_store=self.conversation_store,
+        )
+        self.registry = DocumentRegistry(settings.document_registry_path)
+        self.page_store = PageStore(settings.page_store_path)
+        self.ingestion = IngestionQueue(
+            self.pdf_processor, self.vector_store, self.registry,
+            lexical_index=self.lexical_index,
+            table_store=self.table_store,
+            page_store=self.page_store,
+            on_complete=self.answer_cache.invalidate if self.answer_cache is not None else None,
+        )
+        self.content_index = ContentIndex(os.path.join(settings.pdf_upload_path, ".content_index.sqlite3"))
+
+    def backfill_registry(self) -> None:
+        """
+        One-time import of documents stored before the registry existed.
+        This is the only place that still scans the whole collection.
+        """
+        if not self.registry.is_empty() or self.vector_store.get_document_count() == 0:
+            return
+        documents: Dict[str, Dict[str, Any]] = {}
+        for chunk in self.vector_store.iter_chunks(include_content=False):
+            chunk_id, meta = chunk["id"], chunk["metadata"]
+            if not meta or not meta.get("document_id"):
+                continue
+            doc = documents.setdefault(meta["document_id"], {
+                "document_id": meta["document_id"],
+                "filename": meta.get("filename", ""),
+                "uploaded_at": _parse_datetime(meta.get("uploaded_at")),
+                "status": "processed",
+                "chunk_ids": [],
+            })
+            doc["chunk_ids"].append(chunk_id)
+        for doc in documents.values():
+            self.registry.import_document(doc, doc.pop("chunk_ids"))
+        logger.info(f"Backfilled {len(documents)} documents into the document registry.")
+
+    def backfill_lexical_index(self) -> None:
+        """One-time BM25 indexing of chunks stored before hybrid retrieval was enabled"""
+        if self.lexical_index is None or not self.lexical_index.is_empty() or self.vector_store.get_document_count() == 0:
+            return
+        by_document: Dict[str, Dict[str, list]] = {}
+        for chunk in self.vector_store.iter_chunks():
+            chunk_id, content, meta = chunk["id"], chunk["content"], chunk["metadata"]
+            if not meta or not meta.get("document_id"):
+                continue
+            batch = by_document.setdefault(meta["document_id"], {"ids": [], "docs": []})
+            batch["ids"].append(chunk_id)
+            batch["docs"].append(Document(page_content=content or "", metadata=meta))
+        for document_id, batch in by_document.items():
+            self.lexical_index.add(document_id, batch["ids"], batch["docs"])
+        logger.info(f"Backfilled {len(by_document)} documents into the lexical index.")
+
+    def warmup(self, embedder: Optional[Callable[[str], List[float]]] = None) -> None:
+        """
+        Open the collection and run a no-op embed so the first real request
+        does not pay the cold-start cost. `embedder` defaults to the shared
+        embedding client's `embed_query`. With WARMUP_EMBED=auto only local
+        and hash embedders are warmed up, since a Cohere embed is a billed call.
+        """
+        start_time = time.time()
+        self.vector_store.get_document_count()
+        # Load the context tokenizer now rather than on the first question
+        self.rag_pipeline.context_builder.token_counter.count("warmup")
+        mode = str(getattr(settings, "warmup_embed", "auto")).lower()
+        if mode == "true" or (mode == "auto" and (embedder is not None or settings.embedding_backend != "cohere")):
+            embed = embedder or self.embeddings.embed_query
+            try:
+                embed("warmup")
+            except Exception as e:
+                logger.warning(f"Embedding warm-up failed: {e}")
+        logger.info(f"Services warmed up in {time.time() - start_time:.2f}s.")
+
+    async def aclose(self) -> None:
+        """Close async clients, then release everything else"""
+        await self.rag_pipeline.aclose()
+        self.close()
+
+    def close(self) -> None:
+        """Drain ingestion workers and flush the vector store before shutdown"""
+        self.ingestion.shutdown()
+        self.content_index.close()
+        self.registry.close()
+        self.page_store.close()
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        if self.conversation_store is not None:
+            self.conversation_store.close()
+        try:
+            self.vector_store.close()
+        except Exception as e:
+            logger.warning(f"Failed to persist vector store on shutdown: {e}")
+        logger.info("Services shut down.")
+
+
+def _parse_datetime(value: Any) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+
+def create_services() -> ServiceContainer:
+    """Build the service container and optionally warm it up"""
+    services = ServiceContainer()
+    services.backfill_registry()
+    services.backfill_lexical_index()
+    if getattr(settings, "warmup_on_startup", True):
+        services.warmup()
+    return services
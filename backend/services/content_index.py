@@ -0,0 +1,62 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ContentIndex:
+    """
+    SHA-256 index of uploaded PDFs, stored next to the upload directory,
+    used to recognise a file that has already been ingested.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS content_index ("
+            "sha256 TEXT PRIMARY KEY, document_id TEXT NOT NULL, filename TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_content_document ON content_index(document_id)")
+        self._conn.commit()
+
+    def lookup(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Return the document already stored for this content hash, if any"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT document_id, filename FROM content_index WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"document_id": row[0], "filename": row[1], "sha256": sha256}
+
+    def get_hash(self, document_id: str) -> Optional[str]:
+        """Return the content hash recorded for a document"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256 FROM content_index WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def add(self, sha256: str, document_id: str, filename: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content_index (sha256, document_id, filename) VALUES (?, ?, ?)",
+                (sha256, document_id, filename),
+            )
+            self._conn.commit()
+
+    def remove_document(self, document_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM content_index WHERE document_id = ?", (document_id,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,178 @@
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, List, Set, Tuple
+
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+# Longest chunk overlap looked for when stitching neighbouring chunks
+_MAX_STITCH_CHARS = 1000
+# Chunks at least this similar to one already selected add nothing
+_DUPLICATE_SIMILARITY = 0.9
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # tiktoken downloads encodings on first use, which fails on air-gapped hosts
+        logger.warning(f"Tokenizer {name} unavailable, estimating 4 characters per token: {e}")
+        return None
+
+
+class TokenCounter:
+    """tiktoken-based token counter with a per-text cache"""
+
+    def __init__(self, encoding_name: str = "cl100k_base", cache_size: int = 8192):
+        self.encoding_name = encoding_name
+        self.count = lru_cache(maxsize=cache_size)(self._count)
+
+    @property
+    def encoding(self):
+        return _get_encoding(self.encoding_name)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text down to at most max_tokens tokens"""
+        if max_tokens <= 0:
+            return ""
+        encoding = self.encoding
+        if encoding is None:
+            return text[:max_tokens * 4]
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+    def _count(self, text: str) -> int:
+        encoding = self.encoding
+        if encoding is None:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text, disallowed_special=()))
+
+
+class ContextBuilder:
+    """
+    Assemble the LLM context from retrieved chunks within a token budget.
+    Neighbouring chunks of the same page are stitched together without their
+    overlap when they share at least `min_overlap` characters starting and
+    ending on word boundaries (shorter matches are coincidence, and dropping
+    them would eat text), then passages are picked by maximal marginal relevance (retrieval
+    rank against word-set Jaccard similarity to passages already picked).
+    """
+
+    def __init__(self, token_counter: TokenCounter, mmr_lambda: float = 0.7, separator: str = "\n\n",
+                 min_overlap: int = 30):
+        self.token_counter = token_counter
+        self.mmr_lambda = mmr_lambda
+        self.separator = separator
+        self.min_overlap = min_overlap
+
+    def build(self, documents: List[Tuple[Document, float]], budget: int) -> str:
+        """Return the context for documents, given in retrieval order, using at most `budget` tokens"""
+        passages = self._merge([doc for doc, _ in documents])
+        if not passages:
+            return ""
+        separator_tokens = self.token_counter.count(self.separator)
+        selected: List[str] = []
+        used = 0
+        for text in self._mmr_order(passages):
+            cost = self.token_counter.count(text) + (separator_tokens if selected else 0)
+            if used + cost <= budget:
+                selected.append(text)
+                used += cost
+            elif not selected:
+                # Even the best passage is too long: keep as much of it as fits
+                selected.append(self.token_counter.truncate(text, budget))
+                used = budget
+        logger.info(f"Built context from {len(selected)} of {len(passages)} passages ({used}/{budget} tokens).")
+        return self.separator.join(selected)
+
+    def _merge(self, documents: List[Document]) -> List[str]:
+        """
+        Stitch consecutive chunks of the same page, dropping the text they share.
+        Passages keep the rank of their best chunk.
+        """
+        groups: Dict[Tuple, List[Tuple[int, Document]]] = {}
+        for rank, doc in enumerate(documents):
+            meta = doc.metadata
+            key = (meta.get("document_id"), meta.get("page_num"), meta.get("content_type"))
+            groups.setdefault(key, []).append((rank, doc))
+
+        passages: List[Tuple[int, str]] = []
+        for group in groups.values():
+            group.sort(key=lambda item: item[1].metadata.get("chunk_idx", 0))
+            rank, doc = group[0]
+            text, last_idx = doc.page_content, doc.metadata.get("chunk_idx")
+            for next_rank, next_doc in group[1:]:
+                next_idx = next_doc.metadata.get("chunk_idx")
+                if next_idx == last_idx:
+                    continue
+                if last_idx is not None and next_idx == last_idx + 1:
+                    text = _stitch(text, next_doc.page_content, self.min_overlap)
+                    rank = min(rank, next_rank)
+                else:
+                    passages.append((rank, text))
+                    rank, text = next_rank, next_doc.page_content
+                last_idx = next_idx
+            passages.append((rank, text))
+        passages.sort(key=lambda item: item[0])
+        return [text for _, text in passages]
+
+    def _mmr_order(self, passages: List[str]) -> List[str]:
+        """Order passages by maximal marginal relevance, dropping near duplicates"""
+        words = [_word_set(text) for text in passages]
+        relevance = [1.0 - i / len(passages) for i in range(len(passages))]
+        remaining = list(range(len(passages)))
+        ordered: List[int] = []
+        while remaining:
+            best, best_score = None, None
+            for i in remaining:
+                redundancy = max((_jaccard(words[i], words[j]) for j in ordered), default=0.0)
+                if redundancy >= _DUPLICATE_SIMILARITY:
+                    continue
+                score = self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy
+                if best_score is None or score > best_score:
+                    best, best_score = i, score
+            if best is None:
+                break
+            ordered.append(best)
+            remaining.remove(best)
+        return [passages[i] for i in ordered]
+
+
+def _stitch(left: str, right: str, min_overlap: int = 30) -> str:
+    """
+    Append right to left without repeating the longest suffix/prefix overlap.
+    Overlaps shorter than `min_overlap` or cutting through a word are not
+    trusted; the chunks are then joined on a newline with nothing dropped.
+    """
+    limit = min(len(left), len(right), _MAX_STITCH_CHARS)
+    for size in range(limit, max(min_overlap, 1) - 1, -1):
+        if (left.endswith(right[:size]) and _is_boundary(left, len(left) - size)
+                and _is_boundary(right, size)):
+            return left + right[size:]
+    return f"{left}\n{right}"
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    """True unless `index` falls between two word characters"""
+    if index <= 0 or index >= len(text):
+        return True
+    return not (_is_word_char(text[index - 1]) and _is_word_char(text[index]))
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _word_set(text: str) -> Set[str]:
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
@@ -0,0 +1,81 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """
+    SQLite store of rolling conversation summaries, keyed by conversation id.
+    Each summary records how many leading turns it covers and a digest of
+    those turns, so an edited history is detected instead of trusted.
+    Summaries not updated for `ttl` seconds are purged.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600):
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_summaries ("
+            "conversation_id TEXT PRIMARY KEY, turns INTEGER NOT NULL, history_hash TEXT NOT NULL, "
+            "summary TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.purge_expired()
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT turns, history_hash, summary FROM conversation_summaries "
+                "WHERE conversation_id = ? AND updated_at >= ?",
+                (conversation_id, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"turns": row[0], "history_hash": row[1], "summary": row[2]}
+
+    def get_latest(self, conversation_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """Return the summary covering the most turns among several ids"""
+        if not conversation_ids:
+            return None
+        # Stay well below SQLite's bound-parameter limit; the newest candidates come last
+        conversation_ids = conversation_ids[-500:]
+        placeholders = ",".join("?" * len(conversation_ids))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT turns, history_hash, summary FROM conversation_summaries "
+                f"WHERE conversation_id IN ({placeholders}) AND updated_at >= ? ORDER BY turns DESC LIMIT 1",
+                (*conversation_ids, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"turns": row[0], "history_hash": row[1], "summary": row[2]}
+
+    def put(self, conversation_id: str, turns: int, history_hash: str, summary: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversation_summaries "
+                "(conversation_id, turns, history_hash, summary, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, turns, history_hash, summary, time.time()),
+            )
+
+    def purge_expired(self) -> None:
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM conversation_summaries WHERE updated_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+        if deleted:
+            logger.info(f"Purged {deleted} expired conversation summaries.")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,162 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_DOCUMENT_COLUMNS = "document_id, filename, uploaded_at, chunk_count, status, pages_total, error"
+
+
+class DocumentRegistry:
+    """
+    SQLite table of ingested documents and their chunk ids.
+    Listing, lookup and delete are answered from here instead of scanning
+    every chunk's metadata in the vector store.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "document_id TEXT PRIMARY KEY, filename TEXT NOT NULL, uploaded_at TEXT NOT NULL, "
+            "chunk_count INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL, "
+            "pages_total INTEGER NOT NULL DEFAULT 0, error TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS document_chunks ("
+            "chunk_id TEXT PRIMARY KEY, "
+            "document_id TEXT NOT NULL REFERENCES documents(document_id) ON DELETE CASCADE)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document ON document_chunks(document_id)")
+        self._conn.commit()
+
+    def register(self, document_id: str, filename: str, uploaded_at: datetime, status: str) -> None:
+        """Create the record for a newly uploaded document"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (document_id, filename, uploaded_at, status) VALUES (?, ?, ?, ?)",
+                (document_id, filename, uploaded_at.isoformat(), status),
+            )
+
+    def update(self, document_id: str, **fields: Any) -> None:
+        """Update status, pages_total or error for a document"""
+        fields = {k: v for k, v in fields.items() if k in ("status", "pages_total", "error")}
+        if not fields:
+            return
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE documents SET {assignments} WHERE document_id = ?",
+                (*fields.values(), document_id),
+            )
+
+    def add_chunks(self, document_id: str, chunk_ids: List[str]) -> None:
+        """Record newly stored chunk ids and bump the chunk count in one transaction"""
+        if not chunk_ids:
+            return
+        with self._lock, self._conn:
+            updated = self._conn.execute(
+                "UPDATE documents SET chunk_count = chunk_count + ? WHERE document_id = ?",
+                (len(chunk_ids), document_id),
+            ).rowcount
+            if not updated:
+                # The document was deleted while it was being ingested
+                return
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO document_chunks (chunk_id, document_id) VALUES (?, ?)",
+                [(chunk_id, document_id) for chunk_id in chunk_ids],
+            )
+
+    def replace_chunks(self, document_id: str, chunk_ids: List[str]) -> List[str]:
+        """Swap a document's chunk ids for a new set in one transaction; returns the old ids"""
+        with self._lock, self._conn:
+            old_ids = [row[0] for row in self._conn.execute(
+                "SELECT chunk_id FROM document_chunks WHERE document_id = ?", (document_id,)
+            )]
+            updated = self._conn.execute(
+                "UPDATE documents SET chunk_count = ? WHERE document_id = ?", (len(chunk_ids), document_id)
+            ).rowcount
+            if not updated:
+                return []
+            self._conn.execute("DELETE FROM document_chunks WHERE document_id = ?", (document_id,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO document_chunks (chunk_id, document_id) VALUES (?, ?)",
+                [(chunk_id, document_id) for chunk_id in chunk_ids],
+            )
+        return old_ids
+
+    def import_document(self, record: Dict[str, Any], chunk_ids: List[str]) -> None:
+        """Insert a fully ingested document, used to backfill from the vector store"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (document_id, filename, uploaded_at, chunk_count, status) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (record["document_id"], record["filename"], record["uploaded_at"].isoformat(),
+                 len(chunk_ids), record["status"]),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO document_chunks (chunk_id, document_id) VALUES (?, ?)",
+                [(chunk_id, record["document_id"]) for chunk_id in chunk_ids],
+            )
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_DOCUMENT_COLUMNS} FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        return _to_dict(row) if row else None
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_DOCUMENT_COLUMNS} FROM documents ORDER BY uploaded_at DESC"
+            ).fetchall()
+        return [_to_dict(row) for row in rows]
+
+    def get_chunk_ids(self, document_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM document_chunks WHERE document_id = ?", (document_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Remove a document and its chunk ids; returns the removed record"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT {_DOCUMENT_COLUMNS} FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+        return _to_dict(row)
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _to_dict(row: tuple) -> Dict[str, Any]:
+    document_id, filename, uploaded_at, chunk_count, status, pages_total, error = row
+    return {
+        "document_id": document_id,
+        "filename": filename,
+        "uploaded_at": datetime.fromisoformat(uploaded_at),
+        "chunk_count": chunk_count,
+        "status": status,
+        "pages_total": pages_total,
+        "error": error,
+    }
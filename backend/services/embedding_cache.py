@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies of a chunk share a key"""
+    return " ".join(text.split())
+
+
+# Cohere embeds queries and documents differently, so the input type is part of the key
+QUERY = "search_query"
+DOCUMENT = "search_document"
+
+
+def cache_key(model: str, input_type: str, text: str) -> str:
+    """Content address of a text for a given embedding model and input type"""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{input_type}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-memory LRU in front of a SQLite table.
+    The SQLite tier is capped at `max_entries` and evicts least recently used rows.
+    Recency of hits is buffered and written with the next store (or every
+    `touch_batch` hits), and the row count is kept in memory, so lookups do
+    not write and stores do not scan the table.
+    With `float16` new vectors are stored at half precision, halving the file size.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200000, memory_entries: int = 10000, float16: bool = False,
+                 touch_batch: int = 1000):
+        self.path = path
+        self.dtype = "f2" if float16 else "f4"
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        # Keys hit since recency was last written, with the time of their latest hit
+        self._touched: Dict[str, float] = {}
+        # Guards the memory tier and counters; SQLite has its own lock so lookups
+        # that stay in memory never wait on disk I/O
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")]
+        if "dtype" not in columns:
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN dtype TEXT NOT NULL DEFAULT 'f4'")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """Look up vectors by key; missing entries are returned as None"""
+        results, pending = self._memory_lookup(keys)
+        if pending:
+            self._disk_lookup(results, pending)
+        self._count(results)
+        return results
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """get_many with the SQLite lookup on the default executor"""
+        results, pending = self._memory_lookup(keys)
+        if pending:
+            await asyncio.get_running_loop().run_in_executor(None, self._disk_lookup, results, pending)
+        self._count(results)
+        return results
+
+    def put_many(self, items: List[Tuple[str, List[float]]]) -> None:
+        """Store vectors and evict the oldest rows if the cache is over its cap"""
+        if not items:
+            return
+        self._remember_many(items)
+        self._write(items)
+
+    async def aput_many(self, items: List[Tuple[str, List[float]]]) -> None:
+        """put_many with the SQLite write on the default executor"""
+        if not items:
+            return
+        self._remember_many(items)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, items)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of stored entries"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "memory_entries": len(self._memory),
+                "entries": self._size,
+            }
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+    def _memory_lookup(self, keys: List[str]) -> Tuple[List[Optional[List[float]]], Dict[str, List[int]]]:
+        results: List[Optional[List[float]]] = [None] * len(keys)
+        pending: Dict[str, List[int]] = {}
+        now = time.time()
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._touched[key] = now
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    pending.setdefault(key, []).append(i)
+        return results, pending
+
+    def _disk_lookup(self, results: List[Optional[List[float]]], pending: Dict[str, List[int]]) -> None:
+        with self._db_lock:
+            found = self._select(list(pending))
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched()
+                self._conn.commit()
+        now = time.time()
+        with self._lock:
+            for key, vector in found.items():
+                self._remember(key, vector)
+                self._touched[key] = now
+                for i in pending[key]:
+                    results[i] = vector
+
+    def _count(self, results: List[Optional[List[float]]]) -> None:
+        hits = sum(1 for vector in results if vector is not None)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(results) - hits
+
+    def _remember_many(self, items: List[Tuple[str, List[float]]]) -> None:
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, list(vector))
+
+    def _write(self, items: List[Tuple[str, List[float]]]) -> None:
+        now = time.time()
+        rows = {key: (np.asarray(vector, dtype=self.dtype).tobytes(), self.dtype, now) for key, vector in items}
+        with self._db_lock:
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, dtype, last_used) VALUES (?, ?, ?, ?)",
+                [(key, *row) for key, row in rows.items()],
+            ).rowcount
+            if inserted < len(rows):
+                # Some keys were already stored (e.g. written by a concurrent miss); refresh them
+                self._conn.executemany(
+                    "UPDATE embeddings SET vector = ?, dtype = ?, last_used = ? WHERE key = ?",
+                    [(*row, key) for key, row in rows.items()],
+                )
+            self._size += inserted
+            self._flush_touched()
+            self._evict()
+            self._conn.commit()
+
+    def _flush_touched(self) -> None:
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in touched.items()],
+            )
+
+    def _select(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, vector, dtype FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob, dtype in rows:
+                found[key] = np.frombuffer(blob, dtype=dtype).astype(np.float64).tolist()
+        return found
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self) -> None:
+        overflow = self._size - self.max_entries
+        if overflow > 0:
+            deleted = self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+            self._size -= deleted
+            logger.info(f"Evicted {deleted} entries from embedding cache.")
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying model"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: Optional[str] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._lookup(texts, DOCUMENT)
+        if missing:
+            new_vectors = self.embeddings.embed_documents([texts[i] for i in missing.values()])
+            vectors = self._fill(keys, vectors, missing, new_vectors)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_name, QUERY, text)
+        vector = self.cache.get_many([key])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many([(key, vector)])
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = await self._alookup(texts, DOCUMENT)
+        if missing:
+            new_vectors = await self.embeddings.aembed_documents([texts[i] for i in missing.values()])
+            vectors = await self._afill(keys, vectors, missing, new_vectors)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_name, QUERY, text)
+        vector = (await self.cache.aget_many([key]))[0]
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            await self.cache.aput_many([(key, vector)])
+        return vector
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several search queries, batching the cache misses into one call"""
+        keys, vectors, missing = await self._alookup(texts, QUERY)
+        if missing:
+            new_vectors = await aembed_queries(self.embeddings, [texts[i] for i in missing.values()])
+            vectors = await self._afill(keys, vectors, missing, new_vectors)
+        return vectors
+
+    def _lookup(self, texts: List[str], input_type: str) -> Tuple[List[str], List[Optional[List[float]]], Dict[str, int]]:
+        keys = [cache_key(self.model_name, input_type, text) for text in texts]
+        return keys, *self._missing(keys, self.cache.get_many(keys))
+
+    async def _alookup(self, texts: List[str], input_type: str) -> Tuple[List[str], List[Optional[List[float]]], Dict[str, int]]:
+        keys = [cache_key(self.model_name, input_type, text) for text in texts]
+        return keys, *self._missing(keys, await self.cache.aget_many(keys))
+
+    @staticmethod
+    def _missing(keys: List[str], vectors: List[Optional[List[float]]]) -> Tuple[List[Optional[List[float]]], Dict[str, int]]:
+        # Embed each distinct missing text once
+        missing: Dict[str, int] = {}
+        for i, vector in enumerate(vectors):
+            if vector is None and keys[i] not in missing:
+                missing[keys[i]] = i
+        logger.debug(f"Embedding {len(keys)} texts with {len(missing)} cache misses.")
+        return vectors, missing
+
+    def _fill(self, keys: List[str], vectors: List[Optional[List[float]]], missing: Dict[str, int],
+              new_vectors: List[List[float]]) -> List[List[float]]:
+        fresh = dict(zip(missing, new_vectors))
+        self.cache.put_many(list(fresh.items()))
+        return [vector if vector is not None else fresh[keys[i]] for i, vector in enumerate(vectors)]
+
+    async def _afill(self, keys: List[str], vectors: List[Optional[List[float]]], missing: Dict[str, int],
+                     new_vectors: List[List[float]]) -> List[List[float]]:
+        fresh = dict(zip(missing, new_vectors))
+        await self.cache.aput_many(list(fresh.items()))
+        return [vector if vector is not None else fresh[keys[i]] for i, vector in enumerate(vectors)]
+
+
+async def aembed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Batch-embed queries when the embedder supports it, otherwise embed them concurrently"""
+    if hasattr(embeddings, "aembed_queries"):
+        return await embeddings.aembed_queries(texts)
+    return list(await asyncio.gather(*(embeddings.aembed_query(text) for text in texts)))
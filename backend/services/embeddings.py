@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain.embeddings import CohereEmbeddings
+from langchain.schema.embeddings import Embeddings
+from services.lexical_index import tokenize
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COHERE_MODEL = "embed-english-v2.0"
+DEFAULT_LOCAL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Cohere's embed endpoint accepts at most 96 texts per call
+COHERE_MAX_BATCH = 96
+
+
+class AsyncCohereEmbeddings(CohereEmbeddings):
+    """CohereEmbeddings whose async path awaits the API call before reading the result"""
+
+    async def aembed(self, texts: List[str], *, input_type: Optional[str] = None) -> List[List[float]]:
+        response = await self.async_client.embed(
+            model=self.model,
+            texts=texts,
+            input_type=input_type,
+            truncate=self.truncate,
+        )
+        return [list(map(float, e)) for e in response.embeddings]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several search queries with as few API calls as possible"""
+        vectors = []
+        for i in range(0, len(texts), COHERE_MAX_BATCH):
+            vectors += await self.aembed(texts[i:i + COHERE_MAX_BATCH], input_type="search_query")
+        return vectors
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    sentence-transformers model run in-process, for deployments without API access.
+    Texts are encoded in batches of `batch_size` on `threads` CPU threads
+    (0 keeps torch's default). The async methods run on the default executor.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_LOCAL_MODEL, batch_size: int = 64, threads: int = 0,
+                 device: str = "cpu"):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "The local embedding backend requires sentence-transformers and torch; "
+                "install them from requirements.txt."
+            ) from e
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.model = model_name
+        self.batch_size = batch_size
+        self._encoder = SentenceTransformer(model_name, device=device)
+        # One encode at a time: concurrent calls would only oversubscribe the CPU threads
+        self._lock = threading.Lock()
+        logger.info(f"Loaded local embedding model {model_name} on {device}.")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        with self._lock:
+            vectors = self._encoder.encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self.aembed_documents(texts)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic offline stand-in for benchmarks and tests.
+    Word hashes are folded into a fixed-size signed vector (the hashing trick),
+    so texts sharing words still land close together.
+    """
+
+    def __init__(self, dimensions: int = 384):
+        self.model = f"hash-{dimensions}"
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in tokenize(text):
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+
+def create_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """
+    Build the embedder selected by settings.embedding_backend.
+    Switching backends changes the vector size, so use a fresh CHROMA_PERSIST_DIR.
+    """
+    backend = backend or settings.embedding_backend
+    if backend == "cohere":
+        return AsyncCohereEmbeddings(
+            cohere_api_key=settings.cohere_api_key,
+            model=settings.embedding_model or DEFAULT_COHERE_MODEL,
+        )
+    if backend == "local":
+        return LocalEmbeddings(
+            model_name=settings.embedding_model or DEFAULT_LOCAL_MODEL,
+            batch_size=settings.embedding_batch_size,
+            threads=settings.embedding_threads,
+            device=settings.embedding_device,
+        )
+    if backend == "hash":
+        return HashEmbeddings()
+    raise ValueError(f"Unknown embedding backend: {backend}")
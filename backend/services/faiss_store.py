@@ -0,0 +1,344 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+INDEX_FLAT = "flat"
+INDEX_IVF = "ivf"
+INDEX_HNSW = "hnsw"
+
+# FAISS warns below ~39 training points per IVF list
+_IVF_POINTS_PER_LIST = 39
+
+
+class FaissStore:
+    """
+    FAISS index over normalized embeddings with a SQLite sidecar.
+
+    The sidecar holds each chunk's text, metadata and vector keyed by the
+    integer id used in the index, so document filtering, paging and deletes
+    never touch the index, and the index can always be rebuilt from it.
+    `flat` is exact; `ivf` trains once the corpus has enough vectors (it is
+    served by a flat index until then); `hnsw` cannot remove vectors, so
+    deletes are tombstoned and the graph is rebuilt when they outnumber live ones.
+    The index file is memory-mapped on startup and loaded fully on the first write.
+    """
+
+    def __init__(self, path: str, index_type: str = INDEX_FLAT, nlist: int = 1024, nprobe: int = 16,
+                 hnsw_m: int = 32, ef_search: int = 64, mmap: bool = True, persist_every: int = 5000):
+        if index_type not in (INDEX_FLAT, INDEX_IVF, INDEX_HNSW):
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
+        os.makedirs(path, exist_ok=True)
+        self.index_path = os.path.join(path, "index.faiss")
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.persist_every = persist_every
+        self.index: Optional[faiss.Index] = None
+        self._built_type: Optional[str] = None
+        self._mmapped = False
+        self._pending = 0
+        self._version = 0
+        self._document_vectors: "OrderedDict[str, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+        self._conn = sqlite3.connect(os.path.join(path, "metadata.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, document_id TEXT, page_num INTEGER, "
+            "content TEXT NOT NULL, metadata TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document_page ON chunks(document_id, page_num)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        self._live = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        self._load(mmap)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]], vectors: List[List[float]]) -> None:
+        """Store chunks and their embeddings"""
+        if not ids:
+            return
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            self._ensure_writable(matrix.shape[1])
+            int_ids = []
+            with self._conn:
+                for chunk_id, text, meta, vector in zip(ids, texts, metadatas, matrix):
+                    cursor = self._conn.execute(
+                        "INSERT INTO chunks (chunk_id, document_id, page_num, content, metadata, vector) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (chunk_id, meta.get("document_id"), meta.get("page_num"), text,
+                         json.dumps(meta, default=str), vector.tobytes()),
+                    )
+                    int_ids.append(cursor.lastrowid)
+            self._live += len(int_ids)
+            self.index.add_with_ids(matrix, np.asarray(int_ids, dtype=np.int64))
+            self._touch({meta.get("document_id") for meta in metadatas}, len(ids))
+            if self.index_type == INDEX_IVF and self._built_type != INDEX_IVF and self._live_count() >= self._ivf_train_size():
+                self._rebuild()
+
+    def search(self, vector: List[float], k: int = 5, document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """Return the k nearest chunks with their cosine similarity"""
+        query = _normalize(np.asarray([vector], dtype=np.float32))
+        with self._lock:
+            if self.index is None:
+                return []
+            if document_id:
+                ids, scores = self._search_document(query[0], k, document_id)
+            else:
+                # Tombstoned vectors can occupy result slots, so fetch enough to skip them
+                fetch = min(k + self.index.ntotal - self._live_count(), self.index.ntotal)
+                if fetch <= 0:
+                    return []
+                distances, labels = self.index.search(query, fetch)
+                ids, scores = labels[0], distances[0]
+            rows = self._rows([int(i) for i in ids if i >= 0])
+        results = []
+        for int_id, score in zip(ids, scores):
+            row = rows.get(int(int_id))
+            if row is not None:
+                results.append((Document(page_content=row["content"], metadata=row["metadata"]), float(score)))
+            if len(results) == k:
+                break
+        return results
+
+    def delete(self, ids: List[str]) -> None:
+        """Delete chunks by chunk id"""
+        if not ids:
+            return
+        with self._lock:
+            rows = []
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows += self._conn.execute(
+                    f"SELECT id, document_id FROM chunks WHERE chunk_id IN ({placeholders})", batch
+                ).fetchall()
+            self._remove([row[0] for row in rows], {row[1] for row in rows})
+
+    def delete_where(self, document_id: str) -> None:
+        """Delete every chunk of a document"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM chunks WHERE document_id = ?", (document_id,)).fetchall()
+            self._remove([row[0] for row in rows], {document_id})
+
+    def get(self, document_id: Optional[str] = None, page_from: Optional[int] = None, page_to: Optional[int] = None,
+            offset: int = 0, limit: int = 100, include_content: bool = True) -> List[Dict[str, Any]]:
+        """Get one page of chunks in insertion order"""
+        where, params = _where(document_id, page_from, page_to)
+        columns = "chunk_id, metadata, content" if include_content else "chunk_id, metadata, NULL"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM chunks{where} ORDER BY id LIMIT ? OFFSET ?", (*params, limit, offset)
+            ).fetchall()
+        return [
+            {"id": chunk_id, "content": content, "metadata": json.loads(metadata)}
+            for chunk_id, metadata, content in rows
+        ]
+
+    def get_vectors(self, document_id: str) -> Dict[str, List[float]]:
+        """Map each chunk text of a document to its stored (normalized) vector"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT content, vector FROM chunks WHERE document_id = ?", (document_id,)
+            ).fetchall()
+        return {content: np.frombuffer(vector, dtype=np.float32).tolist() for content, vector in rows}
+
+    def count(self, document_id: Optional[str] = None, page_from: Optional[int] = None, page_to: Optional[int] = None) -> int:
+        where, params = _where(document_id, page_from, page_to)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM chunks{where}", params).fetchone()[0]
+
+    def persist(self) -> None:
+        """Write the index if it changed since the last write"""
+        with self._lock:
+            if self.index is None or self._pending == 0:
+                return
+            tmp_path = f"{self.index_path}.tmp"
+            faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+            with self._conn:
+                self._set_meta("index_version", self._version)
+                self._set_meta("index_type", self._built_type)
+            self._pending = 0
+            logger.info(f"Persisted FAISS {self._built_type} index with {self.index.ntotal} vectors.")
+
+    def close(self) -> None:
+        with self._lock:
+            self.persist()
+            self._conn.close()
+
+    def _load(self, mmap: bool) -> None:
+        self._version = int(self._get_meta("version", 0))
+        index_version = int(self._get_meta("index_version", -1))
+        built_type = self._get_meta("index_type", None)
+        wanted = (built_type == self.index_type
+                  or (self.index_type == INDEX_IVF and built_type == INDEX_FLAT and self._live_count() < self._ivf_train_size()))
+        if os.path.exists(self.index_path) and index_version == self._version and wanted:
+            flags = faiss.IO_FLAG_MMAP if mmap else 0
+            self.index = faiss.read_index(self.index_path, flags)
+            self._built_type = built_type
+            self._mmapped = mmap
+            self._configure()
+            logger.info(f"Loaded FAISS {built_type} index with {self.index.ntotal} vectors.")
+        elif self._live_count() > 0:
+            # The index file is missing, stale or of another type: rebuild from the sidecar
+            self._rebuild()
+            self.persist()
+
+    def _ensure_writable(self, dim: int) -> None:
+        if self.index is None:
+            self._new_index(dim, INDEX_FLAT if self.index_type == INDEX_IVF else self.index_type)
+        elif self._mmapped:
+            # Memory-mapped IVF lists are read-only; switch to an in-memory copy for writes
+            self.index = faiss.read_index(self.index_path)
+            self._mmapped = False
+            self._configure()
+
+    def _new_index(self, dim: int, index_type: str, training: Optional[np.ndarray] = None) -> faiss.Index:
+        if index_type == INDEX_IVF:
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, self.nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(training)
+        elif index_type == INDEX_HNSW:
+            index = faiss.IndexIDMap(faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT))
+        else:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self._built_type = index_type
+        self.index = index
+        self._configure()
+        return index
+
+    def _configure(self) -> None:
+        if self._built_type == INDEX_IVF:
+            faiss.extract_index_ivf(self.index).nprobe = self.nprobe
+        elif self._built_type == INDEX_HNSW:
+            faiss.downcast_index(faiss.downcast_index(self.index).index).hnsw.efSearch = self.ef_search
+
+    def _rebuild(self) -> None:
+        ids, vectors = [], []
+        for int_id, blob in self._conn.execute("SELECT id, vector FROM chunks ORDER BY id"):
+            ids.append(int_id)
+            vectors.append(np.frombuffer(blob, dtype=np.float32))
+        if not ids:
+            self.index = None
+            self._built_type = None
+            return
+        matrix = np.vstack(vectors)
+        index_type = self.index_type
+        training = None
+        if index_type == INDEX_IVF:
+            if len(ids) < self._ivf_train_size():
+                index_type = INDEX_FLAT
+            else:
+                sample = np.random.default_rng(0).choice(len(ids), min(len(ids), self.nlist * 256), replace=False)
+                training = matrix[sample]
+        self._mmapped = False
+        self._new_index(matrix.shape[1], index_type, training)
+        self.index.add_with_ids(matrix, np.asarray(ids, dtype=np.int64))
+        self._pending += 1
+        logger.info(f"Rebuilt FAISS {index_type} index with {len(ids)} vectors.")
+
+    def _remove(self, int_ids: List[int], document_ids: set) -> None:
+        if not int_ids:
+            return
+        self._ensure_writable(self.index.d)
+        with self._conn:
+            for i in range(0, len(int_ids), 500):
+                batch = int_ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+        self._live -= len(int_ids)
+        if self._built_type != INDEX_HNSW:
+            self.index.remove_ids(np.asarray(int_ids, dtype=np.int64))
+        self._touch(document_ids, len(int_ids))
+        if self._built_type == INDEX_HNSW and self.index.ntotal - self._live_count() > self._live_count():
+            self._rebuild()
+
+    def _touch(self, document_ids: set, changed: int) -> None:
+        """Record a mutation: bump the version and persist every `persist_every` changes"""
+        for document_id in document_ids:
+            self._document_vectors.pop(document_id, None)
+        self._version += 1
+        self._pending += changed
+        with self._conn:
+            self._set_meta("version", self._version)
+        if self._pending >= self.persist_every:
+            self.persist()
+
+    def _search_document(self, query: np.ndarray, k: int, document_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact search over one document's vectors, read from the sidecar"""
+        cached = self._document_vectors.get(document_id)
+        if cached is None:
+            rows = self._conn.execute(
+                "SELECT id, vector FROM chunks WHERE document_id = ?", (document_id,)
+            ).fetchall()
+            if not rows:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            cached = (
+                np.asarray([row[0] for row in rows], dtype=np.int64),
+                np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]),
+            )
+            self._document_vectors[document_id] = cached
+            while len(self._document_vectors) > 32:
+                self._document_vectors.popitem(last=False)
+        else:
+            self._document_vectors.move_to_end(document_id)
+        ids, matrix = cached
+        scores = matrix @ query
+        top = np.argsort(-scores)[:k]
+        return ids[top], scores[top]
+
+    def _rows(self, int_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        if not int_ids:
+            return {}
+        placeholders = ",".join("?" * len(int_ids))
+        rows = self._conn.execute(
+            f"SELECT id, content, metadata FROM chunks WHERE id IN ({placeholders})", int_ids
+        ).fetchall()
+        return {int_id: {"content": content, "metadata": json.loads(metadata)} for int_id, content, metadata in rows}
+
+    def _live_count(self) -> int:
+        return self._live
+
+    def _ivf_train_size(self) -> int:
+        return self.nlist * _IVF_POINTS_PER_LIST
+
+    def _get_meta(self, key: str, default: Any) -> Any:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value: Any) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def _where(document_id: Optional[str], page_from: Optional[int], page_to: Optional[int]) -> Tuple[str, tuple]:
+    clauses, params = [], []
+    if document_id:
+        clauses.append("document_id = ?")
+        params.append(document_id)
+    if page_from is not None:
+        clauses.append("page_num >= ?")
+        params.append(page_from)
+    if page_to is not None:
+        clauses.append("page_num <= ?")
+        params.append(page_to)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
@@ -0,0 +1,128 @@
+import os
+import re
+import stat
+from email.utils import formatdate
+from typing import List, Mapping, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_ZEROCOPY = "http.response.zerocopysend"
+
+
+def _etag_values(header: str) -> List[str]:
+    """Opaque tags of an If-None-Match/If-Range header, with weak prefixes dropped"""
+    return [tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()]
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into an inclusive (start, end).
+    Returns None for ranges that should be ignored (malformed or multiple
+    ranges, which are answered with the whole file) and raises ValueError
+    for ranges that cannot be satisfied.
+    """
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last `last` bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """
+    File response with a caller-supplied ETag, conditional GETs (304) and
+    single byte-range requests (206), so viewers can load PDFs incrementally.
+    The body goes out through the ASGI zero-copy extension (sendfile) when
+    the server offers it, and in `chunk_size` reads otherwise.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, request_headers: Mapping[str, str], etag: str, media_type: str,
+                 headers: Optional[Mapping[str, str]] = None, method: str = "GET",
+                 stat_result: Optional[os.stat_result] = None):
+        self.path = path
+        self.media_type = media_type
+        self.background = None
+        self.send_header_only = method.upper() == "HEAD"
+        self.stat_result = stat_result or os.stat(path)
+        if not stat.S_ISREG(self.stat_result.st_mode):
+            raise RuntimeError(f"File at path {path} is not a file.")
+        size = self.stat_result.st_size
+        request_headers = Headers(request_headers)
+
+        self.init_headers(headers)
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = formatdate(self.stat_result.st_mtime, usegmt=True)
+        self.headers["accept-ranges"] = "bytes"
+        self.status_code = 200
+        self.range: Optional[Tuple[int, int]] = (0, size - 1) if size else None
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None and ("*" in _etag_values(if_none_match)
+                                          or etag.removeprefix("W/") in _etag_values(if_none_match)):
+            self.status_code = 304
+            self.range = None
+            for header in ("content-length", "content-type", "content-disposition"):
+                if header in self.headers:
+                    del self.headers[header]
+            return
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        # A stale If-Range (or a weak ETag, which cannot validate ranges) means "send it all"
+        if range_header and (if_range is None or (if_range == etag and not etag.startswith("W/"))):
+            try:
+                requested = parse_range(range_header, size)
+            except ValueError:
+                self.status_code = 416
+                self.range = None
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                return
+            if requested is not None:
+                self.status_code = 206
+                self.range = requested
+                self.headers["content-range"] = f"bytes {requested[0]}-{requested[1]}/{size}"
+        length = self.range[1] - self.range[0] + 1 if self.range else 0
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only or self.range is None:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        start, end = self.range
+        if _ZEROCOPY in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({"type": _ZEROCOPY, "file": file.fileno(), "offset": start, "count": end - start + 1,
+                            "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # The file shrank underneath us; end the body rather than hang the client
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
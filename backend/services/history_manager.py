@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.answer_cache import history_key
+from services.context_builder import TokenCounter
+from services.conversation_store import ConversationStore
+from services.lexical_index import tokenize
+from services.llm import LLMClient
+
+logger = logging.getLogger(__name__)
+
+# Words that only make sense with the earlier conversation; determiners such as
+# "this" or "that" and words like "more" also occur in standalone questions
+_FOLLOW_UP_WORDS = {
+    "it", "its", "these", "those", "they", "them", "their", "he", "she", "his", "her", "him",
+    "previous", "former", "latter",
+}
+_FOLLOW_UP_PREFIXES = ("and ", "but ", "what about", "how about", "compared to", "versus", "vs")
+
+
+def is_follow_up(question: str) -> bool:
+    """Heuristic for questions that cannot be retrieved on without the conversation"""
+    tokens = tokenize(question)
+    return (
+        len(tokens) <= 2
+        or bool(_FOLLOW_UP_WORDS.intersection(tokens))
+        or question.lower().lstrip().startswith(_FOLLOW_UP_PREFIXES)
+    )
+
+
+class HistoryManager:
+    """
+    Bounded chat history for prompts.
+    The last `recent_turns` turns are kept verbatim (each trimmed to
+    `turn_tokens`); older turns are folded into a rolling summary of at most
+    `summary_tokens`, cached per conversation. Aged-out turns are summarized
+    `summary_block` at a time in a background task, and until that summary
+    lands they are sent verbatim. A request only waits for the summary when it
+    lags more than a block behind, since the verbatim window would drop turns.
+    Follow-up questions are rewritten into standalone queries for retrieval.
+    """
+
+    def __init__(self, llm: LLMClient, token_counter: TokenCounter, store: Optional[ConversationStore] = None,
+                 recent_turns: int = 4, summary_tokens: int = 300, turn_tokens: int = 400,
+                 summary_input_tokens: int = 2000, summary_block: int = 4, rewrite_queries: bool = True):
+        self.llm = llm
+        self.token_counter = token_counter
+        self.store = store
+        self.recent_turns = recent_turns
+        self.summary_tokens = summary_tokens
+        self.turn_tokens = turn_tokens
+        # Aged-out turns beyond this many tokens are dropped rather than summarized
+        self.summary_input_tokens = summary_input_tokens
+        self.summary_block = max(summary_block, 1)
+        self.rewrite_queries = rewrite_queries
+        # In-flight summarization tasks by conversation key
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def acompact(self, chat_history: Optional[List[Dict[str, str]]],
+                       conversation_id: Optional[str] = None) -> Tuple[str, List[Dict[str, str]]]:
+        """Return the cached summary of older turns and the trimmed turns it does not cover"""
+        plan = self._plan(chat_history, conversation_id)
+        if plan["prompt"] is None:
+            return plan["summary"], plan["recent"]
+        task = self._pending.get(plan["key"])
+        if task is None:
+            task = asyncio.create_task(self._summarize(plan))
+            self._pending[plan["key"]] = task
+            task.add_done_callback(lambda _, key=plan["key"]: self._pending.pop(key, None))
+        if plan["covered"]:
+            return plan["summary"], plan["recent"]
+
+        # The summary lags more than a block behind, so sending only the verbatim
+        # window would drop turns: wait for the summary instead
+        turns, summary = await asyncio.shield(task)
+        if turns == plan["turns"] and summary:
+            return summary, [self._trim_turn(turn) for turn in chat_history[turns:]]
+        plan = self._plan(chat_history, conversation_id)
+        if not plan["covered"]:
+            # Summarization failed: send every turn the summary does not cover
+            plan["recent"] = [self._trim_turn(turn) for turn in chat_history[plan["start"]:]]
+        return plan["summary"], plan["recent"]
+
+    async def arewrite_query(self, question: str, summary: str, recent: List[Dict[str, str]]) -> str:
+        """Rewrite a follow-up question into a standalone retrieval query"""
+        if not self._needs_rewrite(question, summary, recent):
+            return question
+        try:
+            text = await self.llm.agenerate(self._rewrite_prompt(question, summary, recent))
+        except Exception as e:
+            logger.error(f"Query rewriting failed: {e}")
+            return question
+        return self._parse_rewrite(text, question)
+
+    def _plan(self, chat_history: Optional[List[Dict[str, str]]], conversation_id: Optional[str]) -> Dict[str, Any]:
+        """Split the history and decide whether a block of aged-out turns is due for summarizing"""
+        history = chat_history or []
+        split = max(len(history) - self.recent_turns, 0)
+        plan = {"summary": "", "prompt": None, "start": 0}
+        if split:
+            older = history[:split]
+            # Without an id, a summary is keyed by the digest of the turns it covers
+            digests = [conversation_id] if conversation_id else [f"history:{digest}" for digest in _prefix_digests(older)]
+            cached = self.store.get_latest(digests) if self.store is not None else None
+            if cached and cached["turns"] <= split and history_key(older[:cached["turns"]]) == cached["history_hash"]:
+                plan["summary"], plan["start"] = cached["summary"], cached["turns"]
+            if split - plan["start"] >= self.summary_block:
+                plan.update(
+                    key=digests[-1],
+                    turns=split,
+                    history_hash=history_key(older),
+                    prompt=self._summary_prompt(plan["summary"], older[plan["start"]:]),
+                )
+        # Turns the summary does not cover yet stay verbatim, at most one block beyond the recent ones
+        window = max(len(history) - self.recent_turns - self.summary_block, 0)
+        plan["covered"] = plan["start"] >= window
+        plan["recent"] = [self._trim_turn(turn) for turn in history[max(plan["start"], window):]]
+        return plan
+
+    async def _summarize(self, plan: Dict[str, Any]) -> Tuple[int, str]:
+        """Summarize the planned turns; returns how many turns the summary covers and the summary"""
+        try:
+            text = await self.llm.agenerate(plan["prompt"])
+        except Exception as e:
+            logger.error(f"Conversation summarization failed: {e}")
+            return plan["start"], ""
+        return plan["turns"], self._save_summary(plan, text)
+
+    def _save_summary(self, plan: Dict[str, Any], text: str) -> str:
+        summary = self.token_counter.truncate(text.strip(), self.summary_tokens)
+        if summary and self.store is not None:
+            self.store.put(plan["key"], plan["turns"], plan["history_hash"], summary)
+        return summary
+
+    def _summary_prompt(self, previous: str, turns: List[Dict[str, str]]) -> str:
+        lines: List[str] = []
+        used = 0
+        for turn in reversed(turns):
+            text = self._render_turns([self._trim_turn(turn)])
+            cost = self.token_counter.count(text)
+            if lines and used + cost > self.summary_input_tokens:
+                break
+            lines.insert(0, text)
+            used += cost
+        return "\n".join([
+            "Update the summary of a conversation about financial documents with the new turns below. "
+            "Keep every company, line item, figure, period and conclusion the user may refer back to. "
+            f"Reply with the summary only, in at most {int(self.summary_tokens * 0.75)} words.",
+            "",
+            f"Current summary:\n{previous or '(none)'}",
+            "",
+            "New turns:",
+            *lines,
+            "",
+            "Updated summary:",
+        ])
+
+    def _needs_rewrite(self, question: str, summary: str, recent: List[Dict[str, str]]) -> bool:
+        return self.rewrite_queries and bool(summary or recent) and is_follow_up(question)
+
+    def _rewrite_prompt(self, question: str, summary: str, recent: List[Dict[str, str]]) -> str:
+        parts = [
+            "Rewrite the follow-up question so it can be understood without the conversation. "
+            "Keep company names, line items, figures and years. Reply with the question only.",
+            "",
+        ]
+        if summary:
+            parts.append(f"Conversation summary:\n{summary}")
+        if recent:
+            parts.append(self._render_turns(recent))
+        parts.append(f"Follow-up question: {question}")
+        parts.append("Standalone question:")
+        return "\n".join(parts)
+
+    def _parse_rewrite(self, text: str, question: str) -> str:
+        lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+        if not lines:
+            return question
+        rewritten = lines[0].split(":", 1)[1] if lines[0].lower().startswith("standalone question:") else lines[0]
+        rewritten = rewritten.strip().strip("\"'")
+        # A rambling reply is worse for retrieval than the original question
+        if not rewritten or self.token_counter.count(rewritten) > 3 * self.token_counter.count(question) + 64:
+            return question
+        logger.info(f"Rewrote follow-up {question!r} as {rewritten!r}.")
+        return rewritten
+
+    async def aclose(self) -> None:
+        """Cancel summaries still in flight"""
+        tasks = list(self._pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _trim_turn(self, turn: Dict[str, str]) -> Dict[str, str]:
+        return {
+            "question": self.token_counter.truncate(turn.get("question", ""), self.turn_tokens),
+            "answer": self.token_counter.truncate(turn.get("answer", ""), self.turn_tokens),
+        }
+
+    @staticmethod
+    def _render_turns(turns: List[Dict[str, str]]) -> str:
+        return "\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns)
+
+
+def _prefix_digests(turns: List[Dict[str, str]]) -> List[str]:
+    """history_key of every prefix of turns, in one pass over the history"""
+    digest = hashlib.sha256(b"[")
+    digests = []
+    for i, turn in enumerate(turns):
+        if i:
+            digest.update(b", ")
+        digest.update(json.dumps(turn, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        closed = digest.copy()
+        closed.update(b"]")
+        digests.append(closed.hexdigest())
+    return digests
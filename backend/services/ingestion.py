@@ -0,0 +1,333 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain.schema import Document
+
+from services.pdf_processor import PDFProcessor, count_pages
+from services.vector_store import VectorStoreService
+from services.document_registry import DocumentRegistry
+from services.lexical_index import LexicalIndex
+from services.table_store import TableStore, parse_table
+from services.page_store import PageStore
+from services.metrics import observe_stage
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lifecycle of an ingestion job
+STATUS_QUEUED = "queued"
+STATUS_EXTRACTING = "extracting"
+STATUS_CHUNKING = "chunking"
+STATUS_EMBEDDING = "embedding"
+STATUS_PROCESSED = "processed"
+STATUS_REINDEXING = "reindexing"
+STATUS_FAILED = "failed"
+
+
+class IngestionQueue:
+    """
+    Runs PDF ingestion in the background so /api/upload can return at once.
+    Extraction is CPU-bound and goes to a process pool; chunking and the
+    embedding/persist calls are I/O-bound and run on a thread pool.
+    Extracted pages are kept in the page store so `submit_reindex` can
+    re-chunk a document with new settings without parsing the PDF again.
+    """
+
+    def __init__(self, pdf_processor: PDFProcessor, vector_store: VectorStoreService, registry: DocumentRegistry,
+                 lexical_index: Optional[LexicalIndex] = None, table_store: Optional[TableStore] = None,
+                 page_store: Optional[PageStore] = None, on_complete: Optional[Callable[[str], None]] = None):
+        self.pdf_processor = pdf_processor
+        self.vector_store = vector_store
+        self.registry = registry
+        self.lexical_index = lexical_index
+        self.table_store = table_store
+        self.page_store = page_store
+        # Called with the document_id once its chunks have changed, e.g. to invalidate cached answers
+        self.on_complete = on_complete
+        self._extract_pool = ProcessPoolExecutor(
+            max_workers=settings.ingest_extract_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._worker_pool = ThreadPoolExecutor(
+            max_workers=settings.ingest_workers,
+            thread_name_prefix="ingest",
+        )
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, document_id: str, file_path: str, filename: str) -> Dict[str, Any]:
+        """Queue a stored PDF for ingestion and return its initial status"""
+        job = {
+            "document_id": document_id,
+            "filename": filename,
+            "file_path": file_path,
+            "status": STATUS_QUEUED,
+            "uploaded_at": datetime.utcnow(),
+            "pages_total": 0,
+            "pages_done": 0,
+            "chunks_total": 0,
+            "chunks_embedded": 0,
+            "error": None,
+        }
+        self.registry.register(document_id, filename, job["uploaded_at"], STATUS_QUEUED)
+        with self._lock:
+            self._jobs[document_id] = job
+            snapshot = dict(job)
+        self._worker_pool.submit(self._run, document_id)
+        logger.info(f"Queued document {document_id} for ingestion.")
+        return snapshot
+
+    def submit_reindex(self, document_id: str, force: bool = False) -> bool:
+        """
+        Queue a processed document for re-chunking with the current chunking
+        settings. Returns False when it is not processed, is already being
+        worked on, or was chunked with the same settings (unless `force`).
+        """
+        record = self.registry.get(document_id)
+        if record is None or record["status"] != STATUS_PROCESSED:
+            return False
+        if not force and self._chunking_current(document_id):
+            return False
+        with self._lock:
+            active = self._jobs.get(document_id)
+            if active is not None and active["status"] not in (STATUS_PROCESSED, STATUS_FAILED):
+                return False
+            # The document stays searchable, so the registry keeps reporting it as processed
+            self._jobs[document_id] = {
+                "document_id": document_id,
+                "filename": record["filename"],
+                "file_path": os.path.join(settings.pdf_upload_path, record["filename"]),
+                "status": STATUS_REINDEXING,
+                "uploaded_at": record["uploaded_at"],
+                "pages_total": record["pages_total"],
+                "pages_done": 0,
+                "chunks_total": 0,
+                "chunks_embedded": 0,
+                "error": None,
+            }
+        self._worker_pool.submit(self._reindex, document_id)
+        logger.info(f"Queued document {document_id} for reindexing.")
+        return True
+
+    def get_status(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of the job state, or None if the job is unknown"""
+        with self._lock:
+            job = self._jobs.get(document_id)
+            return dict(job) if job else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Return snapshots of all known jobs"""
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def forget(self, document_id: str) -> None:
+        """Drop the job record for a deleted document"""
+        with self._lock:
+            self._jobs.pop(document_id, None)
+
+    def shutdown(self) -> None:
+        """Stop accepting jobs and wait for running ones to finish"""
+        self._worker_pool.shutdown(wait=True, cancel_futures=True)
+        self._extract_pool.shutdown(wait=True, cancel_futures=True)
+
+    def _update(self, document_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(document_id)
+            if job is None:
+                return
+            job.update(fields)
+        # Only state changes are persisted; progress counters stay in memory
+        if "status" in fields or "pages_total" in fields:
+            self.registry.update(document_id, **fields)
+
+    def _chunking_current(self, document_id: str) -> bool:
+        chunking = self.page_store.get_chunking(document_id) if self.page_store is not None else None
+        return chunking == {"chunk_size": self.pdf_processor.chunk_size, "chunk_overlap": self.pdf_processor.chunk_overlap}
+
+    def _save_chunking(self, document_id: str) -> None:
+        if self.page_store is not None:
+            self.page_store.set_chunking(document_id, self.pdf_processor.chunk_size, self.pdf_processor.chunk_overlap)
+
+    def _iter_pages(self, document_id: str, file_path: str, table_rows: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        pages_done = 0
+        extract_time = 0.0
+        buffered: List[Dict[str, Any]] = []
+        for page in self.pdf_processor.iter_pages(file_path, executor=self._extract_pool):
+            if self.page_store is not None:
+                buffered.append(page)
+                if len(buffered) >= settings.pdf_pages_per_task:
+                    self.page_store.add_pages(document_id, buffered)
+                    buffered = []
+            pages_done += 1
+            extract_time += page.get("extract_time", 0.0)
+            observe_stage("extract_page", page.get("extract_time", 0.0))
+            for table_idx, cells in enumerate(page.get("tables", [])):
+                for record in parse_table(cells):
+                    table_rows.append(dict(record, page_num=page["page_num"], table_idx=table_idx))
+            if pages_done == 1:
+                self._update(document_id, status=STATUS_CHUNKING)
+            self._update(document_id, pages_done=pages_done)
+            yield page
+        if buffered:
+            self.page_store.add_pages(document_id, buffered)
+        logger.info(f"Extracted {pages_done} pages for document {document_id} ({extract_time:.2f}s of page extraction time).")
+
+    def _run(self, document_id: str) -> None:
+        job = self.get_status(document_id)
+        if job is None:
+            return
+        start_time = time.time()
+        stored_ids: List[str] = []
+        try:
+            # Pages stream out of the extraction workers, are split into chunks
+            # and sent to the vector store in micro-batches, so memory stays
+            # flat regardless of document size.
+            self._update(document_id, status=STATUS_EXTRACTING)
+            self._update(document_id, pages_total=count_pages(job["file_path"]))
+            table_rows: List[Dict[str, Any]] = []
+            pages = self._iter_pages(document_id, job["file_path"], table_rows)
+            chunks = self.pdf_processor.split_into_chunks(pages, document_id, job["filename"])
+            uploaded_at = job["uploaded_at"].isoformat()
+            chunks_embedded = 0
+            for batch in _batched(chunks, settings.embedding_batch_size):
+                if chunks_embedded == 0:
+                    self._update(document_id, status=STATUS_EMBEDDING)
+                for doc in batch:
+                    doc.metadata["uploaded_at"] = uploaded_at
+                chunk_ids = self.vector_store.add_documents(batch)
+                stored_ids += chunk_ids
+                self.registry.add_chunks(document_id, chunk_ids)
+                if self.lexical_index is not None:
+                    self.lexical_index.add(document_id, chunk_ids, batch)
+                if self.get_status(document_id) is None:
+                    # Deleted mid-ingestion: drop whatever was stored so far
+                    self._discard(document_id, stored_ids)
+                    logger.info(f"Stopped ingestion of deleted document {document_id}.")
+                    return
+                chunks_embedded += len(batch)
+                self._update(document_id, chunks_embedded=chunks_embedded, chunks_total=chunks_embedded)
+
+            if self.table_store is not None:
+                self.table_store.save(document_id, table_rows)
+            self._save_chunking(document_id)
+            if self.get_status(document_id) is None:
+                # Deleted after the last batch; the delete may have run before these writes
+                self._discard(document_id, stored_ids)
+                logger.info(f"Stopped ingestion of deleted document {document_id}.")
+                return
+            self._update(document_id, status=STATUS_PROCESSED)
+            observe_stage("ingest_document", time.time() - start_time)
+            logger.info(f"Ingested document {document_id} in {time.time() - start_time:.2f}s.")
+        except Exception as e:
+            logger.exception(f"Ingestion failed for document {document_id}")
+            # Drop the partial chunks so a failed document is never half searchable
+            try:
+                self._discard(document_id, stored_ids)
+                self.registry.replace_chunks(document_id, [])
+            except Exception:
+                logger.exception(f"Cleanup after failed ingestion of document {document_id} failed")
+            self._update(document_id, status=STATUS_FAILED, error=str(e), chunks_embedded=0, chunks_total=0)
+        finally:
+            if self.on_complete is not None:
+                self.on_complete(document_id)
+
+    def _discard(self, document_id: str, chunk_ids: List[str]) -> None:
+        """Remove the chunks, tables and cached pages stored by an unfinished ingestion"""
+        if chunk_ids:
+            self.vector_store.delete_documents(chunk_ids)
+        if self.lexical_index is not None:
+            self.lexical_index.remove_document(document_id)
+        if self.table_store is not None:
+            self.table_store.remove(document_id)
+        if self.page_store is not None:
+            self.page_store.remove(document_id)
+
+    def _load_pages(self, document_id: str, file_path: str) -> List[Dict[str, Any]]:
+        """Cached pages of a document, extracting and caching them if it predates the page store"""
+        pages = self.page_store.get_pages(document_id) if self.page_store is not None else []
+        if pages:
+            return pages
+        logger.info(f"No cached pages for document {document_id}; extracting {file_path}.")
+        pages = self.pdf_processor.extract_text_from_pdf(file_path, executor=self._extract_pool)
+        if self.page_store is not None:
+            self.page_store.add_pages(document_id, pages)
+        return pages
+
+    def _reindex(self, document_id: str) -> None:
+        job = self.get_status(document_id)
+        if job is None:
+            return
+        start_time = time.time()
+        chunk_ids: List[str] = []
+        swapped = False
+        try:
+            pages = self._load_pages(document_id, job["file_path"])
+            self._update(document_id, pages_done=len(pages))
+            uploaded_at = job["uploaded_at"].isoformat()
+            chunks = list(self.pdf_processor.split_into_chunks(pages, document_id, job["filename"]))
+            for doc in chunks:
+                doc.metadata["uploaded_at"] = uploaded_at
+            self._update(document_id, chunks_total=len(chunks))
+
+            # Chunks whose text did not change keep their stored embedding
+            stored = self.vector_store.get_document_vectors(document_id)
+            vectors = [stored.get(doc.page_content) for doc in chunks]
+            reused = sum(vector is not None for vector in vectors)
+
+            # The new chunks are added next to the old ones and swapped in per
+            # store afterwards, so the document never has zero chunks
+            for start in range(0, len(chunks), settings.embedding_batch_size):
+                end = start + settings.embedding_batch_size
+                chunk_ids += self.vector_store.add_documents(chunks[start:end], vectors[start:end])
+                self._update(document_id, chunks_embedded=len(chunk_ids))
+                if self.get_status(document_id) is None:
+                    break
+            old_ids = self.registry.replace_chunks(document_id, chunk_ids)
+            swapped = True
+            if self.get_status(document_id) is None or self.registry.get(document_id) is None:
+                self.vector_store.delete_documents(chunk_ids)
+                logger.info(f"Stopped reindexing of deleted document {document_id}.")
+                return
+            if self.lexical_index is not None:
+                self.lexical_index.replace_document(document_id, chunk_ids, chunks)
+            if old_ids:
+                self.vector_store.delete_documents(old_ids)
+
+            self._save_chunking(document_id)
+            if self.get_status(document_id) is None:
+                self._discard(document_id, chunk_ids)
+                logger.info(f"Stopped reindexing of deleted document {document_id}.")
+                return
+            self._update(document_id, status=STATUS_PROCESSED, error=None)
+            observe_stage("reindex_document", time.time() - start_time)
+            logger.info(
+                f"Reindexed document {document_id} into {len(chunks)} chunks ({reused} embeddings reused, "
+                f"{len(chunks) - reused} embedded) in {time.time() - start_time:.2f}s."
+            )
+        except Exception as e:
+            # The previous chunks are still in place, so the document stays usable
+            logger.exception(f"Reindexing failed for document {document_id}")
+            if chunk_ids and not swapped:
+                self.vector_store.delete_documents(chunk_ids)
+            self._update(document_id, status=STATUS_PROCESSED, error=f"Reindexing failed: {e}")
+        finally:
+            if self.on_complete is not None:
+                self.on_complete(document_id)
+
+
+def _batched(documents: Iterator[Document], batch_size: int) -> Iterator[List[Document]]:
+    """Group a stream of documents into lists of at most `batch_size`"""
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,199 @@
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+# Keep figures such as "1,234.5" and tickers such as "brk.b" as single tokens
+_TOKEN_RE = re.compile(r"\w+(?:[.,]\w+)*")
+
+
+# Words too common to help ranking; they are neither indexed nor searched
+STOPWORDS = frozenset(
+    "a about above after again all also am an and any are as at be because been before being below between both "
+    "but by can could did do does doing down during each few for from further had has have having he her here "
+    "hers him his how i if in into is it its itself me more most my no nor not of off on once only or other our "
+    "out over own same she should so some such than that the their theirs them then there these they this those "
+    "through to too under until up very was we were what when where which while who whom why will with would "
+    "you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def index_terms(text: str) -> List[str]:
+    """Tokens that are indexed and searched: tokenize() without stopwords"""
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+class _DocumentPostings:
+    """Inverted index for the chunks of one document"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+        # Per term, (chunk_id, tf, length) by descending tf, built on first search
+        self._impact: Dict[str, List[Tuple[str, int, int]]] = {}
+
+    def add(self, chunk_id: str, tokens: List[str]) -> None:
+        self.lengths[chunk_id] = len(tokens)
+        self.total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+            self._impact.pop(term, None)
+
+    def impact(self, term: str) -> List[Tuple[str, int, int]]:
+        ordered = self._impact.get(term)
+        if ordered is None:
+            ordered = sorted(
+                ((chunk_id, tf, self.lengths[chunk_id]) for chunk_id, tf in self.postings.get(term, {}).items()),
+                key=lambda posting: posting[1],
+                reverse=True,
+            )
+            self._impact[term] = ordered
+        return ordered
+
+
+class LexicalIndex:
+    """
+    BM25 index over chunk text, kept per document_id.
+    Postings live in memory; chunk text and metadata are persisted in SQLite
+    and re-tokenized on startup.
+    Each query term scores at most `max_postings` chunks, taken in
+    descending term frequency across documents, so common terms stay cheap.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, max_postings: int = 1000):
+        self.k1 = k1
+        self.b = b
+        self.max_postings = max_postings
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._documents: Dict[str, _DocumentPostings] = {}
+        self._chunks: Dict[str, Tuple[str, str]] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lexical_chunks ("
+            "chunk_id TEXT PRIMARY KEY, document_id TEXT NOT NULL, content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lexical_document ON lexical_chunks(document_id)")
+        self._conn.commit()
+        self._load()
+
+    def add(self, document_id: str, chunk_ids: List[str], documents: List[Document]) -> None:
+        """Index a batch of stored chunks"""
+        if not chunk_ids:
+            return
+        rows = [
+            (chunk_id, document_id, doc.page_content, json.dumps(doc.metadata, default=str))
+            for chunk_id, doc in zip(chunk_ids, documents)
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO lexical_chunks (chunk_id, document_id, content, metadata) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+            for chunk_id, _, content, metadata in rows:
+                self._index(chunk_id, document_id, content, metadata)
+
+    def remove_document(self, document_id: str) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM lexical_chunks WHERE document_id = ?", (document_id,))
+            self._drop(document_id)
+
+    def replace_document(self, document_id: str, chunk_ids: List[str], documents: List[Document]) -> None:
+        """Swap every chunk of a document for a new set in one step"""
+        rows = [
+            (chunk_id, document_id, doc.page_content, json.dumps(doc.metadata, default=str))
+            for chunk_id, doc in zip(chunk_ids, documents)
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM lexical_chunks WHERE document_id = ?", (document_id,))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO lexical_chunks (chunk_id, document_id, content, metadata) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+            self._drop(document_id)
+            for chunk_id, _, content, metadata in rows:
+                self._index(chunk_id, document_id, content, metadata)
+
+    def _drop(self, document_id: str) -> None:
+        postings = self._documents.pop(document_id, None)
+        if postings is not None:
+            for chunk_id in postings.lengths:
+                self._chunks.pop(chunk_id, None)
+
+    def search(self, query: str, k: int = 5, document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """
+        Return the top-k chunks by BM25 score, optionally within one document.
+        Runs in the caller's thread; async callers should use an executor.
+        """
+        terms = set(index_terms(query))
+        if not terms:
+            return []
+        with self._lock:
+            if document_id:
+                scope = [self._documents[document_id]] if document_id in self._documents else []
+            else:
+                scope = list(self._documents.values())
+            total_chunks = sum(len(doc.lengths) for doc in scope)
+            if total_chunks == 0:
+                return []
+            avg_length = max(sum(doc.total_length for doc in scope) / total_chunks, 1.0)
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                lists = [doc.impact(term) for doc in scope if term in doc.postings]
+                df = sum(len(postings) for postings in lists)
+                if df == 0:
+                    continue
+                idf = math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+                postings = lists[0] if len(lists) == 1 else heapq.merge(*lists, key=lambda posting: posting[1], reverse=True)
+                for chunk_id, tf, length in islice(postings, self.max_postings):
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            results = []
+            for chunk_id, score in top:
+                content, metadata = self._chunks[chunk_id]
+                results.append((Document(page_content=content, metadata=json.loads(metadata)), score))
+        return results
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._chunks
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _index(self, chunk_id: str, document_id: str, content: str, metadata: str) -> None:
+        self._chunks[chunk_id] = (content, metadata)
+        self._documents.setdefault(document_id, _DocumentPostings()).add(chunk_id, index_terms(content))
+
+    def _load(self) -> None:
+        rows = self._conn.execute("SELECT chunk_id, document_id, content, metadata FROM lexical_chunks").fetchall()
+        for chunk_id, document_id, content, metadata in rows:
+            self._index(chunk_id, document_id, content, metadata)
+        if rows:
+            logger.info(f"Loaded {len(rows)} chunks into the lexical index.")
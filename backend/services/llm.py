@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import re
+import time
+from typing import AsyncIterator, Iterator, Optional
+
+import cohere
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClient:
+    """Interface for the chat models used by the RAG pipeline"""
+
+    def generate(self, prompt: str) -> str:
+        """Generate a complete answer for the prompt"""
+        return "".join(self.stream(prompt)).strip()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield answer text fragments as the model produces them"""
+        raise NotImplementedError
+
+    async def agenerate(self, prompt: str) -> str:
+        """Async variant of generate"""
+        return "".join([token async for token in self.astream(prompt)]).strip()
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Async variant of stream"""
+        raise NotImplementedError
+        yield
+
+
+class CohereLLM(LLMClient):
+    def __init__(self, api_key: str, model: str, max_tokens: int):
+        self.api_key = api_key
+        self.client = cohere.Client(api_key)
+        self._async_client = None
+        self.model = model
+        self.max_tokens = max_tokens
+
+    @property
+    def async_client(self) -> cohere.AsyncClient:
+        # Created lazily so the HTTP session belongs to the serving event loop
+        if self._async_client is None:
+            self._async_client = cohere.AsyncClient(self.api_key)
+        return self._async_client
+
+    def generate(self, prompt: str) -> str:
+        response = self.client.chat(
+            message=prompt,
+            model=self.model,
+            max_tokens=self.max_tokens,
+        )
+        return response.text.strip()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        response = self.client.chat(
+            message=prompt,
+            model=self.model,
+            max_tokens=self.max_tokens,
+            stream=True,
+        )
+        for event in response:
+            if event is not None and event.event_type == "text-generation":
+                yield event.text
+
+    async def agenerate(self, prompt: str) -> str:
+        response = await self.async_client.chat(
+            message=prompt,
+            model=self.model,
+            max_tokens=self.max_tokens,
+        )
+        return response.text.strip()
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.async_client.chat(
+            message=prompt,
+            model=self.model,
+            max_tokens=self.max_tokens,
+            stream=True,
+        )
+        async for event in response:
+            if event is not None and event.event_type == "text-generation":
+                yield event.text
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+
+class FakeLLM(LLMClient):
+    """
+    Deterministic local stand-in for tests and offline runs.
+    Answers with the start of the prompt's context, one word per token.
+    """
+
+    def __init__(self, token_delay: float = 0.0, max_words: int = 60):
+        self.token_delay = token_delay
+        self.max_words = max_words
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for token in self._tokens(prompt):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield token
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        for token in self._tokens(prompt):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield token
+
+    def _tokens(self, prompt: str) -> Iterator[str]:
+        match = re.search(r"Context:\n(.*?)(?:\nUser:|\Z)", prompt, re.S)
+        source = match.group(1) if match else "I could not find relevant information in the document."
+        words = source.split()[:self.max_words]
+        for i, word in enumerate(words):
+            yield word if i == 0 else f" {word}"
+
+
+def create_llm(backend: Optional[str] = None) -> LLMClient:
+    """Build the LLM client selected by settings.llm_backend"""
+    backend = backend or settings.llm_backend
+    if backend == "cohere":
+        return CohereLLM(settings.cohere_api_key, settings.llm_model, settings.max_tokens)
+    if backend == "fake":
+        return FakeLLM()
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,90 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PageStore:
+    """
+    SQLite cache of each document's extracted pages (text and table cells),
+    so documents can be re-chunked without parsing the PDF again.
+    Also records the chunking parameters a document was last split with.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "document_id TEXT NOT NULL, page_num INTEGER NOT NULL, text BLOB NOT NULL, tables BLOB, "
+            "PRIMARY KEY (document_id, page_num))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunking ("
+            "document_id TEXT PRIMARY KEY, chunk_size INTEGER NOT NULL, chunk_overlap INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def add_pages(self, document_id: str, pages: List[Dict[str, Any]]) -> None:
+        """Store extracted pages; text and tables are zlib-compressed"""
+        if not pages:
+            return
+        rows = [
+            (
+                document_id,
+                page["page_num"],
+                zlib.compress(page["text"].encode("utf-8")),
+                zlib.compress(json.dumps(page["tables"]).encode("utf-8")) if page.get("tables") else None,
+            )
+            for page in pages
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (document_id, page_num, text, tables) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def get_pages(self, document_id: str) -> List[Dict[str, Any]]:
+        """Return the cached pages of a document in page order, or [] if none are cached"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page_num, text, tables FROM pages WHERE document_id = ? ORDER BY page_num", (document_id,)
+            ).fetchall()
+        pages = []
+        for page_num, text, tables in rows:
+            page = {"page_num": page_num, "text": zlib.decompress(text).decode("utf-8")}
+            if tables is not None:
+                page["tables"] = json.loads(zlib.decompress(tables))
+            pages.append(page)
+        return pages
+
+    def set_chunking(self, document_id: str, chunk_size: int, chunk_overlap: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunking (document_id, chunk_size, chunk_overlap) VALUES (?, ?, ?)",
+                (document_id, chunk_size, chunk_overlap),
+            )
+
+    def get_chunking(self, document_id: str) -> Optional[Dict[str, int]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chunk_size, chunk_overlap FROM chunking WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        return {"chunk_size": row[0], "chunk_overlap": row[1]} if row else None
+
+    def remove(self, document_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pages WHERE document_id = ?", (document_id,))
+            self._conn.execute("DELETE FROM chunking WHERE document_id = ?", (document_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,93 +1,226 @@
+import asyncio
 import logging
 import time
 import os
+from concurrent.futures import Executor, ThreadPoolExecutor
 
-import cohere
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, AsyncIterator, Iterator, Tuple, Optional
 from langchain.schema import Document
-from services.vector_store import VectorStoreService
+from services.vector_store import AsyncVectorStoreService, VectorStoreService
+from services.llm import LLMClient, create_llm
+from services.answer_cache import AnswerCache, CACHE_HIT_EXACT, CACHE_HIT_SEMANTIC
+from services.lexical_index import LexicalIndex
+from services.table_store import TableStore
+from services.context_builder import ContextBuilder, TokenCounter
+from services.conversation_store import ConversationStore
+from services.history_manager import HistoryManager
+from services.metrics import ANSWERS, observe_stage, span
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+FALLBACK_ANSWER = "Sorry, I couldn't generate an answer at this time."
 
-class RAGPipeline:
-    def __init__(self):
+
+class RAGPipelineBase:
+    """
+    Helper base holding the retrieval, caching and prompt-building pieces of
+    the pipeline; it does not answer questions itself. AsyncRAGPipeline
+    implements answering on top of it.
+    """
+
+    def __init__(self, vector_store: Optional[VectorStoreService] = None, llm: Optional[LLMClient] = None,
+                 answer_cache: Optional[AnswerCache] = None, lexical_index: Optional[LexicalIndex] = None,
+                 table_store: Optional[TableStore] = None, conversation_store: Optional[ConversationStore] = None):
         # Load config from .env via settings or os.environ
         self.llm_model = getattr(settings, "llm_model", os.getenv("llm_model", "command"))
         self.max_tokens = int(getattr(settings, "max_tokens", os.getenv("MAX_TOKENS", 512)))
         self.retrieval_k = int(getattr(settings, "retrieval_k", os.getenv("RETRIEVAL_K", 5)))
         self.similarity_threshold = float(getattr(settings, "similarity_threshold", os.getenv("SIMILARITY_THRESHOLD", 0.0)))
-        self.cohere_api_key = getattr(settings, "cohere_api_key", os.getenv("COHERE_API_KEY"))
-        self.cohere_client = cohere.Client(self.cohere_api_key)
+        self.llm = llm or create_llm()
 
-        self.vector_store = VectorStoreService()
+        self.vector_store = vector_store or VectorStoreService()
+        self.answer_cache = answer_cache
+        # Optional BM25 leg fused with dense results by reciprocal rank
+        self.lexical_index = lexical_index
+        self.lexical_k = settings.lexical_k
+        self.rrf_k = settings.rrf_k
+        # Optional structured table rows for answering figure lookups directly
+        self.table_store = table_store
+        self.context_window = settings.llm_context_window
+        self.context_max_tokens = settings.context_max_tokens
+        self.context_builder = ContextBuilder(
+            TokenCounter(settings.context_tokenizer),
+            settings.context_mmr_lambda,
+            min_overlap=settings.context_min_stitch_chars,
+        )
+        # Older turns are summarized per conversation instead of replayed verbatim
+        self.history_manager = HistoryManager(
+            self.llm,
+            self.context_builder.token_counter,
+            conversation_store,
+            recent_turns=settings.history_recent_turns,
+            summary_tokens=settings.history_summary_tokens,
+            turn_tokens=settings.history_turn_tokens,
+            summary_block=settings.history_summary_block,
+            rewrite_queries=settings.history_query_rewrite,
+        ) if settings.history_compaction else None
 
-    def generate_answer(self, question: str, chat_history: List[Dict[str, str]] = None, document_id: Optional[str] = None) -> Dict[str, Any]:
-        """Generate answer using RAG pipeline"""
-        start_time = time.time()
-        # 1. Retrieve relevant documents
-        retrieved_docs = self._retrieve_documents(question, document_id=document_id)
-        # 2. Generate context from retrieved documents
-        context = self._generate_context(retrieved_docs)
-        # 3. Generate answer using Cohere LLM
-        answer = self._generate_llm_response(question, context, chat_history)
-        # 4. Return answer with sources and processing time
-        processing_time = time.time() - start_time
+    def _cache_key(self, question: str, chat_history: Optional[List[Dict[str, str]]], document_id: Optional[str]) -> Optional[str]:
+        if self.answer_cache is None or not question:
+            return None
+        return self.answer_cache.make_key(question, document_id, chat_history)
+
+    def _cache_get_exact(self, cache_key: Optional[str], start_time: float) -> Optional[Dict[str, Any]]:
+        """Level one: same normalized question, document and chat history"""
+        if cache_key is None:
+            return None
+        with span("cache_lookup"):
+            cached = self.answer_cache.get_exact(cache_key)
+        if cached is None:
+            return None
+        return self._cache_hit_result(cached, CACHE_HIT_EXACT, 1.0, start_time)
+
+    def _cache_get_semantic(self, question: str, query_embedding: Optional[List[float]],
+                            chat_history: Optional[List[Dict[str, str]]], document_id: Optional[str],
+                            start_time: float) -> Optional[Dict[str, Any]]:
+        """Level two: a close enough question embedding with the same figures, document and history"""
+        if self.answer_cache is None or query_embedding is None:
+            return None
+        with span("cache_lookup"):
+            match = self.answer_cache.get_semantic(question, query_embedding, document_id, chat_history)
+        if match is None:
+            return None
+        cached, similarity = match
+        return self._cache_hit_result(cached, CACHE_HIT_SEMANTIC, similarity, start_time)
+
+    def _cache_hit_result(self, cached: Dict[str, Any], kind: str, similarity: float, start_time: float) -> Dict[str, Any]:
+        logger.info(f"Answered from the {kind} answer cache (similarity {similarity:.3f}).")
+        ANSWERS.inc(source=kind)
+        return {
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "processing_time": time.time() - start_time,
+            "cache_hit": kind,
+            "cache_similarity": similarity,
+        }
+
+    def _cache_put(self, cache_key: Optional[str], result: Dict[str, Any], chat_history: Optional[List[Dict[str, str]]],
+                   document_id: Optional[str], question: str, query_embedding: Optional[List[float]]) -> None:
+        # Failed generations are not worth repeating
+        if cache_key is None or not result["answer"] or result["answer"] == FALLBACK_ANSWER:
+            return
+        self.answer_cache.put(
+            cache_key,
+            {"answer": result["answer"], "sources": result["sources"]},
+            document_id,
+            chat_history,
+            embedding=query_embedding,
+            question=question,
+        )
+
+    def _replay_result(self, result: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Emit a cached or table answer as the same event sequence as a live stream"""
+        yield {"event": "sources", "data": result["sources"]}
+        yield {"event": "token", "data": {"text": result["answer"]}}
+        yield {
+            "event": "done",
+            "data": {
+                "processing_time": result["processing_time"],
+                "cache_hit": result.get("cache_hit"),
+                "cache_similarity": result.get("cache_similarity"),
+                "structured_answer": result.get("structured_answer", False),
+            },
+        }
+
+    def _table_result(self, match: Optional[Dict[str, Any]], start_time: float) -> Optional[Dict[str, Any]]:
+        if match is None:
+            return None
+        rows = match["rows"]
+        if len(rows) == 1:
+            answer = f"{match['line_item']} ({rows[0]['period']}): {rows[0]['raw']} (page {rows[0]['page_num']})."
+        else:
+            figures = "; ".join(f"{row['period']}: {row['raw']} (page {row['page_num']})" for row in rows)
+            answer = f"{match['line_item']}: {figures}."
+        tables: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        for row in rows:
+            tables.setdefault((row["page_num"], row["table_idx"]), []).append(row)
         sources = [
             {
-                "content": doc.page_content,
-                "page": doc.metadata.get("page_num", -1),
-                "score": score,
-                "metadata": doc.metadata,
+                "content": "\n".join(f"{row['line_item']} | {row['period']} | {row['raw']}" for row in table_rows),
+                "page": page_num,
+                "score": 1.0,
+                "metadata": {
+                    "document_id": table_rows[0]["document_id"],
+                    "page_num": page_num,
+                    "content_type": "table",
+                    "table_idx": table_idx,
+                },
             }
-            for doc, score in retrieved_docs
+            for (page_num, table_idx), table_rows in tables.items()
         ]
+        logger.info(f"Answered from extracted table rows for line item '{match['line_item']}'.")
+        ANSWERS.inc(source="table")
         return {
             "answer": answer,
             "sources": sources,
-            "processing_time": processing_time,
+            "processing_time": time.time() - start_time,
+            "cache_hit": None,
+            "structured_answer": True,
         }
 
-    def _retrieve_documents(self, query: str, document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
-        """Retrieve relevant documents for the query"""
-        results = self.vector_store.similarity_search(query, k=self.retrieval_k, document_id=document_id)
-        filtered = [
-            (doc, score)
-            for doc, score in results
-            if score >= self.similarity_threshold
+    def _format_sources(self, documents: List[Tuple[Document, float]]) -> List[Dict[str, Any]]:
+        """Convert retrieved documents into the source dicts returned to clients"""
+        return [
+            {
+                "content": doc.page_content,
+                "page": doc.metadata.get("page_num", -1),
+                "score": score,
+                "metadata": doc.metadata,
+            }
+            for doc, score in documents
         ]
+
+    def _filter_results(self, results: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+        """Apply the similarity threshold to raw search results"""
+        with span("threshold_filter"):
+            filtered = [
+                (doc, score)
+                for doc, score in results
+                if score >= self.similarity_threshold
+            ]
         logger.info(f"Retrieved {len(filtered)} documents above similarity threshold.")
         return filtered
 
-    def _generate_context(self, documents: List[Tuple[Document, float]]) -> str:
-        """Generate context string from retrieved documents"""
-        context_chunks = []
-        total_chars = 0
-        for doc, score in documents:
-            chunk = doc.page_content
-            if total_chars + len(chunk) > 3000 * 4:  # rough estimate: 1 token ≈ 4 chars
-                break
-            context_chunks.append(chunk)
-            total_chars += len(chunk)
-        return "\n\n".join(context_chunks)
-
-    def _generate_llm_response(self, question: str, context: str, chat_history: List[Dict[str, str]] = None) -> str:
-        """Generate response using Cohere LLM"""
-        prompt = self._build_prompt(question, context, chat_history)
-        try:
-            response = self.cohere_client.chat(
-                message=prompt,
-                model=self.llm_model,
-                max_tokens=self.max_tokens,
-            )
-            return response.text.strip()
-        except Exception as e:
-            logger.error(f"LLM generation failed: {e}")
-            return "Sorry, I couldn't generate an answer at this time."
+    def _fuse(self, dense: List[Tuple[Document, float]],
+              lexical: List[Tuple[Document, float]]) -> List[Tuple[Document, Optional[float]]]:
+        """
+        Rank dense and BM25 hits by reciprocal rank fusion.
+        The score stays the dense cosine similarity (None for BM25-only hits);
+        the fused value goes to metadata["rrf_score"].
+        """
+        if not lexical:
+            return dense
+        similarity = {_chunk_key(doc): score for doc, score in dense}
+        fused = [
+            (Document(page_content=doc.page_content, metadata={**doc.metadata, "rrf_score": rrf}),
+             similarity.get(_chunk_key(doc)))
+            for doc, rrf in reciprocal_rank_fusion([dense, lexical], k=self.rrf_k)[:self.retrieval_k]
+        ]
+        logger.info(f"Fused {len(dense)} dense and {len(lexical)} lexical results into {len(fused)}.")
+        return fused
 
-    def _build_prompt(self, question: str, context: str, chat_history: List[Dict[str, str]] = None) -> str:
-        """Build prompt for Cohere LLM with context and chat history"""
+    def _generate_context(self, documents: List[Tuple[Document, float]], question: str = "",
+                          chat_history: List[Dict[str, str]] = None, summary: str = "") -> str:
+        """Generate context string from retrieved documents within the prompt's token budget"""
+        with span("context_build"):
+            prompt_tokens = self.context_builder.token_counter.count(self._build_prompt(question, "", chat_history, summary))
+            budget = min(self.context_max_tokens, self.context_window - self.max_tokens - prompt_tokens)
+            return self.context_builder.build(documents, max(budget, 0))
+
+    def _build_prompt(self, question: str, context: str, chat_history: List[Dict[str, str]] = None,
+                      summary: str = "") -> str:
+        """Build prompt for Cohere LLM with context, the summary of older turns and chat history"""
         messages = []
         if chat_history:
             for chat in chat_history:
@@ -100,7 +233,348 @@ class RAGPipeline:
         prompt_parts = [system_prompt]
         if context:
             prompt_parts.append(f"Context:\n{context}")
+        if summary:
+            prompt_parts.append(f"Earlier conversation summary:\n{summary}")
         prompt_parts.extend(messages)
         prompt_parts.append(f"User: {question}")
         prompt_parts.append("Assistant:")
         return "\n".join(prompt_parts)
+
+
+class AsyncRAGPipeline(RAGPipelineBase):
+    """
+    Non-blocking RAG pipeline for the request path.
+    Embedding and LLM calls use async clients, Chroma runs on a bounded
+    executor, and every request is held to `chat_timeout` seconds.
+    Cancelling the awaiting task (e.g. on client disconnect) stops the work.
+    """
+
+    def __init__(self, vector_store: Optional[VectorStoreService] = None, llm: Optional[LLMClient] = None,
+                 executor: Optional[Executor] = None, answer_cache: Optional[AnswerCache] = None,
+                 lexical_index: Optional[LexicalIndex] = None, table_store: Optional[TableStore] = None,
+                 conversation_store: Optional[ConversationStore] = None):
+        super().__init__(vector_store=vector_store, llm=llm, answer_cache=answer_cache,
+                         lexical_index=lexical_index, table_store=table_store, conversation_store=conversation_store)
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=settings.rag_io_workers,
+            thread_name_prefix="rag-io",
+        )
+        self.async_vector_store = AsyncVectorStoreService(self.vector_store, self.executor)
+        self.timeout = settings.chat_timeout
+        self.batch_concurrency = settings.batch_llm_concurrency
+
+    async def agenerate_answer(self, question: str, chat_history: List[Dict[str, str]] = None, document_id: Optional[str] = None,
+                                  conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """Generate answer using RAG pipeline without blocking the event loop"""
+        return await asyncio.wait_for(
+            self._agenerate_answer(question, chat_history, document_id, conversation_id), self.timeout
+        )
+
+    async def _agenerate_answer(self, question: str, chat_history: List[Dict[str, str]] = None, document_id: Optional[str] = None,
+                                   conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        start_time = time.time()
+        cache_key = self._cache_key(question, chat_history, document_id)
+        cached = self._cache_get_exact(cache_key, start_time)
+        if cached is not None:
+            return cached
+        search_query, summary, recent_history = await self._acompact_history(question, chat_history, conversation_id)
+        cached = await self._atable_answer(search_query, document_id, start_time)
+        if cached is not None:
+            return cached
+        query_embedding = await self._aembed_query(search_query) if search_query else None
+        cached = self._cache_get_semantic(search_query, query_embedding, chat_history, document_id, start_time)
+        if cached is not None:
+            return cached
+        retrieved_docs = await self._aretrieve_documents(search_query, document_id=document_id, query_embedding=query_embedding)
+        context = self._generate_context(retrieved_docs, question, recent_history, summary)
+        answer = await self._agenerate_llm_response(question, context, recent_history, summary)
+        result = {
+            "answer": answer,
+            "sources": self._format_sources(retrieved_docs),
+            "processing_time": time.time() - start_time,
+            "cache_hit": None,
+        }
+        self._cache_put(cache_key, result, chat_history, document_id, search_query, query_embedding)
+        return result
+
+    async def astream_answer(self, question: str, chat_history: List[Dict[str, str]] = None, document_id: Optional[str] = None,
+                                conversation_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream answer events; raises asyncio.TimeoutError past the deadline"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        start_time = time.time()
+        cache_key = self._cache_key(question, chat_history, document_id)
+        cached = self._cache_get_exact(cache_key, start_time)
+        search_query, summary, recent_history = question, "", chat_history
+        if cached is None:
+            search_query, summary, recent_history = await asyncio.wait_for(
+                self._acompact_history(question, chat_history, conversation_id), deadline - loop.time()
+            )
+            cached = await self._atable_answer(search_query, document_id, start_time)
+        query_embedding = None
+        if cached is None and search_query:
+            query_embedding = await asyncio.wait_for(self._aembed_query(search_query), deadline - loop.time())
+            cached = self._cache_get_semantic(search_query, query_embedding, chat_history, document_id, start_time)
+        if cached is not None:
+            for event in self._replay_result(cached):
+                yield event
+            return
+
+        retrieved_docs = await asyncio.wait_for(
+            self._aretrieve_documents(search_query, document_id=document_id, query_embedding=query_embedding),
+            deadline - loop.time(),
+        )
+        retrieval_time = time.time() - start_time
+        sources = self._format_sources(retrieved_docs)
+        yield {"event": "sources", "data": sources}
+
+        context = self._generate_context(retrieved_docs, question, recent_history, summary)
+        prompt = self._build_prompt(question, context, recent_history, summary)
+        generation_start = time.time()
+        first_token_time = None
+        answer_parts = []
+        tokens = self.llm.astream(prompt).__aiter__()
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(tokens.__anext__(), deadline - loop.time())
+                except StopAsyncIteration:
+                    break
+                if first_token_time is None:
+                    first_token_time = time.time() - generation_start
+                answer_parts.append(token)
+                yield {"event": "token", "data": {"text": token}}
+            self._cache_put(cache_key, {"answer": "".join(answer_parts).strip(), "sources": sources},
+                            chat_history, document_id, search_query, query_embedding)
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            logger.error(f"LLM streaming failed: {e}")
+            yield {"event": "error", "data": {"message": FALLBACK_ANSWER}}
+        finally:
+            await tokens.aclose()
+
+        generation_time = time.time() - generation_start
+        ANSWERS.inc(source="llm")
+        observe_stage("llm_generate", generation_time)
+        if first_token_time is not None:
+            observe_stage("llm_first_token", first_token_time)
+        yield {
+            "event": "done",
+            "data": {
+                "processing_time": time.time() - start_time,
+                "timings": {
+                    "retrieval": retrieval_time,
+                    "time_to_first_token": first_token_time,
+                    "generation": generation_time,
+                },
+            },
+        }
+
+    async def abatch_answer(self, questions: List[str], document_ids: Optional[List[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answer every question against every document_id (or across all documents).
+        All queries are embedded in one batched call, each document is searched
+        for all queries at once, and LLM calls run at most `batch_concurrency`
+        at a time. Yields a "chunk" event the first time a retrieved chunk is
+        seen and a "result" event per question, in completion order.
+        """
+        targets = list(dict.fromkeys(document_ids)) if document_ids else [None]
+        items = [
+            {"index": i, "question": question, "document_id": document_id, "start_time": time.time()}
+            for i, (document_id, question) in enumerate((d, q) for d in targets for q in questions)
+        ]
+        seen_chunks: set = set()
+
+        # 1. Exact cache hits and table lookups need no embedding at all
+        pending = []
+        for item in items:
+            item["cache_key"] = self._cache_key(item["question"], None, item["document_id"])
+            cached = (self._cache_get_exact(item["cache_key"], item["start_time"])
+                      or await self._atable_answer(item["question"], item["document_id"], item["start_time"]))
+            if cached is not None:
+                for event in self._batch_events(item, cached, seen_chunks):
+                    yield event
+            else:
+                pending.append(item)
+        if not pending:
+            return
+
+        # 2. One embedding call for all distinct questions, then semantic cache hits
+        unique_questions = list(dict.fromkeys(item["question"] for item in pending))
+        with span("query_embedding"):
+            vectors = dict(zip(unique_questions, await self.async_vector_store.embed_queries(unique_questions)))
+        remaining = []
+        for item in pending:
+            item["embedding"] = vectors[item["question"]]
+            cached = self._cache_get_semantic(item["question"], item["embedding"], None, item["document_id"], item["start_time"])
+            if cached is not None:
+                for event in self._batch_events(item, cached, seen_chunks):
+                    yield event
+            else:
+                remaining.append(item)
+        if not remaining:
+            return
+
+        # Repeated question/document pairs share one search and one generation
+        duplicates: Dict[Tuple[str, Optional[str]], List[Dict[str, Any]]] = {}
+        for item in remaining:
+            duplicates.setdefault((item["question"], item["document_id"]), []).append(item)
+        remaining = [group[0] for group in duplicates.values()]
+
+        # 3. One multi-query search per document
+        groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for item in remaining:
+            groups.setdefault(item["document_id"], []).append(item)
+        with span("vector_search"):
+            searches = await asyncio.gather(*(
+                self.async_vector_store.similarity_search_by_vectors(
+                    [item["embedding"] for item in group], k=self.retrieval_k, document_id=document_id
+                )
+                for document_id, group in groups.items()
+            ))
+        searched = [(item, result) for group, results in zip(groups.values(), searches) for item, result in zip(group, results)]
+        fused = await asyncio.gather(*(
+            self._afuse_lexical(item["question"], self._filter_results(result), item["document_id"])
+            for item, result in searched
+        ))
+        for (item, _), documents in zip(searched, fused):
+            item["documents"] = documents
+
+        # 4. Bounded concurrent generation, streamed back as each answer finishes
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def answer(item: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+            async with semaphore:
+                context = self._generate_context(item["documents"], item["question"])
+                try:
+                    text = await asyncio.wait_for(
+                        self._agenerate_llm_response(item["question"], context), self.timeout
+                    )
+                except asyncio.TimeoutError:
+                    logger.error(f"Batch question {item['index']} timed out.")
+                    text = FALLBACK_ANSWER
+            result = {
+                "answer": text,
+                "sources": self._format_sources(item["documents"]),
+                "processing_time": time.time() - item["start_time"],
+                "cache_hit": None,
+            }
+            self._cache_put(item["cache_key"], result, None, item["document_id"], item["question"], item["embedding"])
+            return item, result
+
+        tasks = [asyncio.ensure_future(answer(item)) for item in remaining]
+        try:
+            for future in asyncio.as_completed(tasks):
+                item, result = await future
+                for duplicate in duplicates[(item["question"], item["document_id"])]:
+                    for event in self._batch_events(duplicate, result, seen_chunks):
+                        yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _batch_events(self, item: Dict[str, Any], result: Dict[str, Any], seen_chunks: set) -> Iterator[Dict[str, Any]]:
+        """Emit each retrieved chunk once, then the result referencing chunks by id"""
+        sources = []
+        for source in result["sources"]:
+            meta = source["metadata"]
+            chunk_id = f"{meta.get('document_id')}:{source['page']}:{meta.get('chunk_idx')}"
+            if chunk_id not in seen_chunks:
+                seen_chunks.add(chunk_id)
+                yield {
+                    "event": "chunk",
+                    "data": {"chunk_id": chunk_id, "content": source["content"], "page": source["page"], "metadata": meta},
+                }
+            sources.append({"chunk_id": chunk_id, "page": source["page"], "score": source["score"]})
+        yield {
+            "event": "result",
+            "data": {
+                "index": item["index"],
+                "question": item["question"],
+                "document_id": item["document_id"],
+                "answer": result["answer"],
+                "sources": sources,
+                "processing_time": result["processing_time"],
+                "cache_hit": result.get("cache_hit"),
+                "structured_answer": result.get("structured_answer", False),
+            },
+        }
+
+    async def _acompact_history(self, question: str, chat_history: Optional[List[Dict[str, str]]],
+                                conversation_id: Optional[str]) -> Tuple[str, str, List[Dict[str, str]]]:
+        if self.history_manager is None or not chat_history:
+            return question, "", chat_history or []
+        with span("history"):
+            summary, recent = await self.history_manager.acompact(chat_history, conversation_id)
+            return await self.history_manager.arewrite_query(question, summary, recent), summary, recent
+
+    async def _aembed_query(self, query: str) -> List[float]:
+        with span("query_embedding"):
+            return await self.async_vector_store.embed_query(query)
+
+    async def _aretrieve_documents(self, query: str, document_id: Optional[str] = None,
+                                   query_embedding: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        if not query:
+            return []
+        if query_embedding is None:
+            query_embedding = await self._aembed_query(query)
+        with span("vector_search"):
+            results = await self.async_vector_store.similarity_search_by_vector(query_embedding, k=self.retrieval_k, document_id=document_id)
+        return await self._afuse_lexical(query, self._filter_results(results), document_id)
+
+    async def _afuse_lexical(self, query: str, dense: List[Tuple[Document, float]],
+                             document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """Fuse BM25 hits into the dense results; scoring runs on the executor"""
+        if self.lexical_index is None:
+            return dense
+        with span("lexical_search"):
+            lexical = await self.async_vector_store.run_blocking(
+                self.lexical_index.search, query, k=self.lexical_k, document_id=document_id
+            )
+        return self._fuse(dense, lexical)
+
+    async def _atable_answer(self, question: str, document_id: Optional[str], start_time: float) -> Optional[Dict[str, Any]]:
+        if self.table_store is None or not question:
+            return None
+        # Table files are read from disk, so the lookup runs on the executor
+        with span("table_lookup"):
+            match = await self.async_vector_store.run_blocking(self.table_store.lookup, question, document_id)
+        return self._table_result(match, start_time)
+
+    async def _agenerate_llm_response(self, question: str, context: str, chat_history: List[Dict[str, str]] = None,
+                                      summary: str = "") -> str:
+        prompt = self._build_prompt(question, context, chat_history, summary)
+        ANSWERS.inc(source="llm")
+        try:
+            with span("llm_generate"):
+                return await self.llm.agenerate(prompt)
+        except Exception as e:
+            logger.error(f"LLM generation failed: {e}")
+            return FALLBACK_ANSWER
+
+    async def aclose(self) -> None:
+        """Close async clients, pending history summaries and the blocking-call executor"""
+        if self.history_manager is not None:
+            await self.history_manager.aclose()
+        if hasattr(self.llm, "aclose"):
+            await self.llm.aclose()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _chunk_key(doc: Document) -> Tuple[Any, Any, Any]:
+    meta = doc.metadata
+    return meta.get("document_id"), meta.get("page_num"), meta.get("chunk_idx")
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Tuple[Document, float]]], k: int = 60) -> List[Tuple[Document, float]]:
+    """Combine ranked lists by summing 1 / (k + rank) per chunk"""
+    scores: Dict[Tuple[Any, Any, Any], float] = {}
+    documents: Dict[Tuple[Any, Any, Any], Document] = {}
+    for results in result_lists:
+        for rank, (doc, _) in enumerate(results, start=1):
+            key = _chunk_key(doc)
+            documents.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(documents[key], score) for key, score in ranked]
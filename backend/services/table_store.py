@@ -0,0 +1,250 @@
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from services.lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+_NUMBER_RE = re.compile(r"^\(?\s*[-+]?\s*[$€£¥₩]?\s*\d[\d,]*(?:\.\d+)?\s*%?\s*\)?$")
+_YEAR_RE = re.compile(r"\b(?:19|20)\d{2}\b")
+# Questions asking for an explanation need the LLM even when a figure matches
+_EXPLANATORY = {"why", "explain", "describe", "compare", "trend", "reason", "reasons", "impact", "summarize", "analysis"}
+_STOPWORDS = {
+    "a", "an", "the", "of", "in", "for", "to", "and", "on", "at", "by", "is", "was", "were", "are", "what",
+    "how", "much", "many", "did", "does", "do", "company", "company's", "total", "amount", "value",
+    "during", "year", "fy", "as", "with", "from", "its", "their", "be", "been",
+}
+# Share of the line item's tokens the question must contain, and of the
+# question's content tokens the line item must contain
+_MIN_COVERAGE = 0.75
+
+
+def parse_number(text: str) -> Optional[float]:
+    """Parse a financial figure such as "1,234", "(56.7)" or "12%"; None if not a number"""
+    text = text.strip()
+    if not text or not _NUMBER_RE.match(text):
+        return None
+    negative = text.startswith("(") and text.endswith(")") or "-" in text
+    digits = re.sub(r"[^\d.]", "", text)
+    try:
+        value = float(digits)
+    except ValueError:
+        return None
+    return -value if negative else value
+
+
+def _is_header_row(row: List[str]) -> bool:
+    """A row without figures, or whose only figures are years, is a header"""
+    figures = [cell for cell in row[1:] if parse_number(cell) is not None]
+    return all(_YEAR_RE.fullmatch(cell.strip()) for cell in figures)
+
+
+def parse_table(cells: List[List[Optional[str]]]) -> List[Dict[str, Any]]:
+    """
+    Turn a pdfplumber cell grid into (line_item, period, value) records.
+    Leading rows without figures form the column headers; None cells are
+    merged cells and inherit from their left (headers) or upper (labels) neighbour.
+    """
+    rows = [[(cell or "").replace("\n", " ").strip() if cell is not None else None for cell in row] for row in cells]
+    if len(rows) < 2 or max(len(row) for row in rows) < 2:
+        return []
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+
+    header_count = 0
+    while header_count < len(rows) - 1 and _is_header_row([cell or "" for cell in rows[header_count]]):
+        header_count += 1
+    headers = [""] * width
+    for row in rows[:header_count]:
+        previous = ""
+        for j, cell in enumerate(row):
+            cell = previous if cell is None else cell
+            previous = cell
+            if cell and cell not in headers[j]:
+                headers[j] = f"{headers[j]} {cell}".strip()
+
+    records = []
+    label = ""
+    for row in rows[header_count:]:
+        if row[0] is not None:
+            label = row[0]
+        row_label = label
+        for j, cell in enumerate(row[1:], start=1):
+            if not cell:
+                continue
+            value = parse_number(cell)
+            if value is None:
+                if not row_label or parse_number(row_label) is not None:
+                    row_label = cell
+                continue
+            if row_label:
+                records.append({
+                    "line_item": row_label,
+                    "period": headers[j] or f"column {j + 1}",
+                    "value": value,
+                    "raw": cell,
+                })
+    return records
+
+
+def format_table(cells: List[List[Optional[str]]]) -> List[str]:
+    """Render a cell grid as pipe-separated lines, one per row"""
+    lines = []
+    for row in cells:
+        values = [(cell or "").replace("\n", " ").strip() for cell in row]
+        if any(values):
+            lines.append(" | ".join(values))
+    return lines
+
+
+class _DocumentTable:
+    """Dictionary-encoded columns for one document's table records"""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.line_items = columns["line_items"]
+        self.periods = columns["periods"]
+        self.line_item_codes = columns["line_item_codes"]
+        self.period_codes = columns["period_codes"]
+        self.values = columns["values"]
+        self.raw = columns["raw"]
+        self.pages = columns["pages"]
+        self.tables = columns["tables"]
+        self.line_item_tokens = [_content_tokens(item) for item in self.line_items]
+
+
+class TableStore:
+    """
+    Columnar store of structured table rows, one compressed .npz file per
+    document, used to answer numeric lookups without an LLM call.
+    Line items and periods are dictionary-encoded; values are float64.
+    """
+
+    def __init__(self, path: str, cache_documents: int = 64):
+        self.path = path
+        self.cache_documents = cache_documents
+        os.makedirs(path, exist_ok=True)
+        self._cache: "OrderedDict[str, Optional[_DocumentTable]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._document_ids: Set[str] = {
+            name[:-4] for name in os.listdir(path) if name.endswith(".npz") and not name.startswith(".")
+        }
+
+    def save(self, document_id: str, records: List[Dict[str, Any]]) -> None:
+        """Replace the stored rows of a document"""
+        if not records:
+            self.remove(document_id)
+            return
+        line_items, line_item_codes = np.unique([r["line_item"] for r in records], return_inverse=True)
+        periods, period_codes = np.unique([r["period"] for r in records], return_inverse=True)
+        tmp_path = os.path.join(self.path, f".{document_id}.tmp.npz")
+        np.savez_compressed(
+            tmp_path,
+            line_items=line_items,
+            periods=periods,
+            line_item_codes=line_item_codes.astype(np.int32),
+            period_codes=period_codes.astype(np.int32),
+            values=np.asarray([r["value"] for r in records], dtype=np.float64),
+            raw=np.asarray([r["raw"] for r in records]),
+            pages=np.asarray([r["page_num"] for r in records], dtype=np.int32),
+            tables=np.asarray([r["table_idx"] for r in records], dtype=np.int32),
+        )
+        os.replace(tmp_path, self._file(document_id))
+        with self._lock:
+            self._cache.pop(document_id, None)
+            self._document_ids.add(document_id)
+        logger.info(f"Stored {len(records)} table rows ({len(line_items)} line items) for document {document_id}.")
+
+    def remove(self, document_id: str) -> None:
+        with self._lock:
+            self._cache.pop(document_id, None)
+            self._document_ids.discard(document_id)
+        if os.path.exists(self._file(document_id)):
+            os.remove(self._file(document_id))
+
+    def document_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._document_ids)
+
+    def lookup(self, question: str, document_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Answer a numeric lookup such as "What was total revenue in 2023?".
+        Returns None unless exactly one line item matches the question well,
+        i.e. it covers most of the question beyond stopwords and years, so
+        "revenue from China" does not match a plain "Revenue" row.
+        Loads table files from disk; call it off the event loop.
+        """
+        tokens = tokenize(question)
+        if not tokens or _EXPLANATORY.intersection(tokens):
+            return None
+        years = set(_YEAR_RE.findall(question))
+        question_tokens = set(tokens) - _STOPWORDS - years
+        if not question_tokens:
+            return None
+
+        best_score = 0.0
+        matches = []
+        for doc_id in ([document_id] if document_id else self.document_ids()):
+            table = self._load(doc_id)
+            if table is None:
+                continue
+            for code, item_tokens in enumerate(table.line_item_tokens):
+                if not item_tokens:
+                    continue
+                overlap = len(item_tokens & question_tokens)
+                if overlap / len(item_tokens) < _MIN_COVERAGE or overlap / len(question_tokens) < _MIN_COVERAGE:
+                    continue
+                # Coverage of the line item, ties broken towards longer names
+                score = overlap / len(item_tokens) + overlap * 1e-3
+                if score > best_score:
+                    best_score, matches = score, [(doc_id, table, code)]
+                elif score == best_score:
+                    matches.append((doc_id, table, code))
+        if len({table.line_items[code] for _, table, code in matches}) != 1:
+            return None
+
+        rows = []
+        for doc_id, table, code in matches:
+            for i in np.flatnonzero(table.line_item_codes == code):
+                period = str(table.periods[table.period_codes[i]])
+                if years and not years.intersection(_YEAR_RE.findall(period)):
+                    continue
+                rows.append({
+                    "document_id": doc_id,
+                    "line_item": str(table.line_items[code]),
+                    "period": period,
+                    "value": float(table.values[i]),
+                    "raw": str(table.raw[i]),
+                    "page_num": int(table.pages[i]),
+                    "table_idx": int(table.tables[i]),
+                })
+        if not rows or len({row["document_id"] for row in rows}) > 1:
+            return None
+        return {"line_item": rows[0]["line_item"], "rows": rows}
+
+    def _file(self, document_id: str) -> str:
+        return os.path.join(self.path, f"{document_id}.npz")
+
+    def _load(self, document_id: str) -> Optional[_DocumentTable]:
+        with self._lock:
+            if document_id in self._cache:
+                self._cache.move_to_end(document_id)
+                return self._cache[document_id]
+        table = None
+        if os.path.exists(self._file(document_id)):
+            with np.load(self._file(document_id), allow_pickle=False) as columns:
+                table = _DocumentTable({name: columns[name] for name in columns.files})
+        with self._lock:
+            self._cache[document_id] = table
+            while len(self._cache) > self.cache_documents:
+                self._cache.popitem(last=False)
+        return table
+
+
+def _content_tokens(text: str) -> Set[str]:
+    return set(tokenize(text)) - _STOPWORDS
@@ -1,47 +1,142 @@
-from typing import List, Tuple, Optional
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Dict, Iterator, List, Tuple, Optional
+import chromadb
+import numpy as np
 from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
 from langchain.vectorstores import Chroma
-from langchain.embeddings import OpenAIEmbeddings, CohereEmbeddings
+from services.embedding_cache import CachedEmbeddings, EmbeddingCache, aembed_queries
+from services.embeddings import create_embeddings
+from services.faiss_store import FaissStore
+from services.metrics import span
 from config import settings
 import logging
 import os
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# langchain's default collection name, kept so existing stores still open
+_COLLECTION_NAME = "langchain"
+
 
 class VectorStoreService:
-    def __init__(self):
+    def __init__(self, embeddings: Optional[Embeddings] = None):
         # Grab configuration from .env via settings or os.environ
         persist_dir = getattr(settings, "chroma_persist_dir", os.getenv("CHROMA_PERSIST_DIR", "chroma_db"))
-        cohere_api_key = getattr(settings, "cohere_api_key", os.getenv("COHERE_API_KEY"))
         os.makedirs(persist_dir, exist_ok=True)
-        self.embeddings = CohereEmbeddings(cohere_api_key=cohere_api_key)
+        self._init_embeddings(embeddings)
+        client = chromadb.PersistentClient(path=persist_dir)
+        # Collections created before cosine distance keep their L2 space (opening one
+        # with new metadata would relabel it, not rebuild it); vectors are
+        # unit-normalized for them so L2 ranks like cosine
+        existing = {collection.name: collection for collection in client.list_collections()}.get(_COLLECTION_NAME)
+        self._l2_space = existing is not None and (existing.metadata or {}).get("hnsw:space", "l2") == "l2"
         self.vector_store = Chroma(
+            collection_name=_COLLECTION_NAME,
+            client=client,
             persist_directory=persist_dir,
-            embedding_function=self.embeddings
+            embedding_function=self.embeddings,
+            collection_metadata=None if existing is not None else {"hnsw:space": "cosine"},
         )
-    
-    def add_documents(self, documents: List[Document]) -> None:
-        """Add documents to the vector store"""
+        if self._l2_space and self.vector_store._collection.count():
+            logger.warning(
+                "Chroma collection uses L2 distance; run POST /api/documents/reindex?force=true "
+                "so chunks stored before vectors were normalized rank by cosine similarity."
+            )
+
+    def _init_embeddings(self, embeddings: Optional[Embeddings]) -> None:
+        self.base_embeddings = embeddings or create_embeddings()
+        self.embedding_cache = None
+        if getattr(settings, "embedding_cache_enabled", True):
+            self.embedding_cache = EmbeddingCache(
+                settings.embedding_cache_path,
+                max_entries=settings.embedding_cache_max_entries,
+                memory_entries=settings.embedding_cache_memory_entries,
+                float16=settings.embedding_cache_float16,
+            )
+            self.embeddings = CachedEmbeddings(self.base_embeddings, self.embedding_cache)
+        else:
+            self.embeddings = self.base_embeddings
+
+    def _embed_missing(self, texts: List[str], vectors: Optional[List[Optional[List[float]]]]) -> List[List[float]]:
+        """Embed the texts that have no precomputed vector"""
+        vectors = list(vectors) if vectors is not None else [None] * len(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            with span("embed"):
+                embedded = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        return vectors
+
+    def add_documents(self, documents: List[Document], vectors: Optional[List[Optional[List[float]]]] = None) -> List[str]:
+        """
+        Add documents to the vector store and return their ids.
+        `vectors` may carry precomputed embeddings; only None entries are embedded.
+        """
         if not documents:
             logger.warning("No documents to add to vector store.")
-            return
-        self.vector_store.add_documents(documents)
-        self.vector_store.persist()
+            return []
+        texts = [doc.page_content for doc in documents]
+        vectors = self._embed_missing(texts, vectors)
+        if self._l2_space:
+            vectors = _unit_rows(vectors)
+        ids = [str(uuid.uuid4()) for _ in documents]
+        with span("persist"):
+            self.vector_store._collection.upsert(
+                ids=ids,
+                embeddings=vectors,
+                documents=texts,
+                metadatas=[doc.metadata for doc in documents],
+            )
+            self.vector_store.persist()
         logger.info(f"Added {len(documents)} documents to vector store.")
+        return ids
 
     def similarity_search(self, query: str, k: int = 5, document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
         """Search for similar documents"""
         if not query:
             logger.warning("Empty query for similarity search.")
             return []
-        if document_id:
-            results = self.vector_store.similarity_search_with_score(query, k=k, filter={"document_id": document_id})
-        else:
-            results = self.vector_store.similarity_search_with_score(query, k=k)
+        return self.similarity_search_by_vector(self.embed_query(query), k=k, document_id=document_id)
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query"""
+        return self.embeddings.embed_query(query)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 5, document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """Search for documents similar to an already embedded query"""
+        results = self.similarity_search_by_vectors([embedding], k=k, document_id=document_id)[0]
         logger.info(f"Found {len(results)} similar documents for query.")
         return results
 
+    def similarity_search_by_vectors(self, embeddings: List[List[float]], k: int = 5,
+                                     document_id: Optional[str] = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Run several vector searches in a single Chroma query.
+        Scores are cosine similarities, the same scale FaissVectorStoreService uses.
+        """
+        if not embeddings:
+            return []
+        if self._l2_space:
+            embeddings = _unit_rows(embeddings)
+        result = self.vector_store._collection.query(
+            query_embeddings=embeddings,
+            n_results=k,
+            where={"document_id": document_id} if document_id else None,
+            include=["documents", "metadatas", "distances"],
+        )
+        # Cosine space returns 1 - cos; L2 space returns the squared distance, 2 - 2cos for unit vectors
+        to_score = (lambda distance: 1.0 - distance / 2.0) if self._l2_space else (lambda distance: 1.0 - distance)
+        return [
+            [(Document(page_content=content, metadata=meta or {}), to_score(distance))
+             for content, meta, distance in zip(contents, metas, distances)]
+            for contents, metas, distances in zip(result["documents"], result["metadatas"], result["distances"])
+        ]
+
     def delete_documents(self, document_ids: List[str]) -> None:
         """Delete documents from vector store"""
         if not document_ids:
@@ -51,8 +146,250 @@ class VectorStoreService:
         self.vector_store.persist()
         logger.info(f"Deleted {len(document_ids)} documents from vector store.")
 
+    def delete_by_document_id(self, document_id: str) -> None:
+        """Delete every chunk belonging to a document"""
+        self.vector_store._collection.delete(where={"document_id": document_id})
+        self.vector_store.persist()
+        logger.info(f"Deleted chunks of document {document_id} from vector store.")
+
+    def get_document_vectors(self, document_id: str, batch_size: int = 500) -> Dict[str, List[float]]:
+        """Map each stored chunk text of a document to its embedding"""
+        vectors: Dict[str, List[float]] = {}
+        offset = 0
+        while True:
+            result = self.vector_store._collection.get(
+                where={"document_id": document_id},
+                offset=offset,
+                limit=batch_size,
+                include=["documents", "embeddings"],
+            )
+            for content, vector in zip(result["documents"], result["embeddings"]):
+                vectors[content] = list(vector)
+            if len(result["ids"]) < batch_size:
+                return vectors
+            offset += batch_size
+
+    def get_chunks(self, document_id: Optional[str] = None, page_from: Optional[int] = None, page_to: Optional[int] = None,
+                   offset: int = 0, limit: int = 100, include_content: bool = True) -> List[Dict[str, Any]]:
+        """Get one page of stored chunks, optionally filtered by document and page range"""
+        include = ["metadatas", "documents"] if include_content else ["metadatas"]
+        result = self.vector_store._collection.get(
+            where=_chunk_filter(document_id, page_from, page_to),
+            offset=offset,
+            limit=limit,
+            include=include,
+        )
+        documents = result.get("documents") or [None] * len(result["ids"])
+        return [
+            {
+                "id": chunk_id,
+                "content": content,
+                "page": (meta or {}).get("page_num", -1),
+                "metadata": meta or {},
+            }
+            for chunk_id, content, meta in zip(result["ids"], documents, result["metadatas"])
+        ]
+
+    def iter_chunks(self, document_id: Optional[str] = None, page_from: Optional[int] = None, page_to: Optional[int] = None,
+                    offset: int = 0, limit: Optional[int] = None, include_content: bool = True,
+                    batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Yield matching chunks page by page so large result sets never sit in memory at once"""
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            chunks = self.get_chunks(document_id, page_from, page_to, offset, size, include_content)
+            yield from chunks
+            if len(chunks) < size:
+                return
+            offset += len(chunks)
+            if remaining is not None:
+                remaining -= len(chunks)
+
+    def count_chunks(self, document_id: Optional[str] = None, page_from: Optional[int] = None, page_to: Optional[int] = None) -> int:
+        """Count chunks matching a filter"""
+        where = _chunk_filter(document_id, page_from, page_to)
+        if where is None:
+            return self.vector_store._collection.count()
+        return len(self.vector_store._collection.get(where=where, include=[])["ids"])
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Get embedding cache hit/miss counters"""
+        if self.embedding_cache is None:
+            return {}
+        return self.embedding_cache.stats()
+
+    def close(self) -> None:
+        """Persist the store and release the embedding cache"""
+        self.vector_store.persist()
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+
     def get_document_count(self) -> int:
         """Get total number of documents in vector store"""
         count = self.vector_store._collection.count()
         logger.info(f"Vector store contains {count} documents.")
         return count
+
+
+class FaissVectorStoreService(VectorStoreService):
+    """
+    VectorStoreService backed by a FAISS index in `vector_db_path`, for corpora
+    where Chroma's query latency and memory use become the bottleneck.
+    Scores are cosine similarities.
+    """
+
+    def __init__(self, embeddings: Optional[Embeddings] = None):
+        self._init_embeddings(embeddings)
+        self.vector_store = FaissStore(
+            settings.vector_db_path,
+            index_type=settings.faiss_index_type,
+            nlist=settings.faiss_nlist,
+            nprobe=settings.faiss_nprobe,
+            hnsw_m=settings.faiss_hnsw_m,
+            ef_search=settings.faiss_ef_search,
+            mmap=settings.faiss_mmap,
+            persist_every=settings.faiss_persist_every,
+        )
+
+    def add_documents(self, documents: List[Document], vectors: Optional[List[Optional[List[float]]]] = None) -> List[str]:
+        """Embed documents (except those with precomputed `vectors`), add them to the index and return their ids"""
+        if not documents:
+            logger.warning("No documents to add to vector store.")
+            return []
+        texts = [doc.page_content for doc in documents]
+        vectors = self._embed_missing(texts, vectors)
+        ids = [str(uuid.uuid4()) for _ in documents]
+        with span("persist"):
+            self.vector_store.add(ids, texts, [doc.metadata for doc in documents], vectors)
+        logger.info(f"Added {len(documents)} documents to vector store.")
+        return ids
+
+    def similarity_search(self, query: str, k: int = 5, document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """Search for similar documents"""
+        if not query:
+            logger.warning("Empty query for similarity search.")
+            return []
+        return self.similarity_search_by_vector(self.embed_query(query), k=k, document_id=document_id)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 5, document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """Search for documents similar to an already embedded query"""
+        results = self.vector_store.search(embedding, k=k, document_id=document_id)
+        logger.info(f"Found {len(results)} similar documents for query.")
+        return results
+
+    def similarity_search_by_vectors(self, embeddings: List[List[float]], k: int = 5,
+                                     document_id: Optional[str] = None) -> List[List[Tuple[Document, float]]]:
+        """Run several vector searches; each is an in-process index lookup"""
+        return [self.vector_store.search(embedding, k=k, document_id=document_id) for embedding in embeddings]
+
+    def delete_documents(self, document_ids: List[str]) -> None:
+        """Delete documents from vector store"""
+        if not document_ids:
+            logger.warning("No document IDs provided for deletion.")
+            return
+        self.vector_store.delete(document_ids)
+        logger.info(f"Deleted {len(document_ids)} documents from vector store.")
+
+    def delete_by_document_id(self, document_id: str) -> None:
+        """Delete every chunk belonging to a document"""
+        self.vector_store.delete_where(document_id)
+        logger.info(f"Deleted chunks of document {document_id} from vector store.")
+
+    def get_document_vectors(self, document_id: str, batch_size: int = 500) -> Dict[str, List[float]]:
+        """Map each stored chunk text of a document to its embedding"""
+        return self.vector_store.get_vectors(document_id)
+
+    def get_chunks(self, document_id: Optional[str] = None, page_from: Optional[int] = None, page_to: Optional[int] = None,
+                   offset: int = 0, limit: int = 100, include_content: bool = True) -> List[Dict[str, Any]]:
+        """Get one page of stored chunks, optionally filtered by document and page range"""
+        chunks = self.vector_store.get(document_id, page_from, page_to, offset, limit, include_content)
+        for chunk in chunks:
+            chunk["page"] = chunk["metadata"].get("page_num", -1)
+        return chunks
+
+    def count_chunks(self, document_id: Optional[str] = None, page_from: Optional[int] = None, page_to: Optional[int] = None) -> int:
+        """Count chunks matching a filter"""
+        return self.vector_store.count(document_id, page_from, page_to)
+
+    def close(self) -> None:
+        """Write the index and release the sidecar and embedding cache"""
+        self.vector_store.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+
+    def get_document_count(self) -> int:
+        """Get total number of documents in vector store"""
+        count = self.vector_store.count()
+        logger.info(f"Vector store contains {count} documents.")
+        return count
+
+
+def _unit_rows(vectors: List[List[float]]) -> List[List[float]]:
+    """Scale each vector to unit length"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).tolist()
+
+
+def create_vector_store(embeddings: Optional[Embeddings] = None) -> VectorStoreService:
+    """Build the vector store selected by settings.vector_db_type"""
+    if settings.vector_db_type == "chromadb":
+        return VectorStoreService(embeddings)
+    if settings.vector_db_type == "faiss":
+        return FaissVectorStoreService(embeddings)
+    raise ValueError(f"Unknown vector database type: {settings.vector_db_type}")
+
+
+class AsyncVectorStoreService:
+    """
+    Async facade over VectorStoreService for the request path.
+    Query embeddings use the embedding client's async API; Chroma calls, which
+    have no async API, run on a dedicated bounded executor so they never block
+    the event loop or compete with the default executor.
+    """
+
+    def __init__(self, vector_store: VectorStoreService, executor: Executor):
+        self.vector_store = vector_store
+        self.executor = executor
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Run a blocking call on the dedicated executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def embed_query(self, query: str) -> List[float]:
+        return await self.vector_store.embeddings.aembed_query(query)
+
+    async def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return await aembed_queries(self.vector_store.embeddings, queries)
+
+    async def similarity_search_by_vector(self, embedding: List[float], k: int = 5, document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        return await self.run_blocking(self.vector_store.similarity_search_by_vector, embedding, k, document_id)
+
+    async def similarity_search_by_vectors(self, embeddings: List[List[float]], k: int = 5,
+                                           document_id: Optional[str] = None) -> List[List[Tuple[Document, float]]]:
+        return await self.run_blocking(self.vector_store.similarity_search_by_vectors, embeddings, k, document_id)
+
+    async def similarity_search(self, query: str, k: int = 5, document_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        if not query:
+            logger.warning("Empty query for similarity search.")
+            return []
+        embedding = await self.embed_query(query)
+        return await self.similarity_search_by_vector(embedding, k, document_id)
+
+
+def _chunk_filter(document_id: Optional[str], page_from: Optional[int], page_to: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Build a Chroma where clause for document and page-range filters"""
+    conditions = []
+    if document_id:
+        conditions.append({"document_id": document_id})
+    if page_from is not None:
+        conditions.append({"page_num": {"$gte": page_from}})
+    if page_to is not None:
+        conditions.append({"page_num": {"$lte": page_to}})
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
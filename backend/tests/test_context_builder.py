@@ -0,0 +1,37 @@
+from langchain.schema import Document
+
+from services.context_builder import ContextBuilder, TokenCounter, _stitch
+
+SENTENCE = "Operating income for the year rose on higher margins in every segment. "
+
+
+def _chunk(text: str, chunk_idx: int) -> Document:
+    return Document(page_content=text, metadata={"document_id": "doc", "page_num": 1, "chunk_idx": chunk_idx})
+
+
+def test_stitch_drops_a_real_overlap():
+    left = "Revenue grew in the first half. " + SENTENCE.strip()
+    right = SENTENCE + "Net income doubled."
+    assert _stitch(left, right) == "Revenue grew in the first half. " + SENTENCE + "Net income doubled."
+
+
+def test_stitch_keeps_digits_on_a_short_coincidental_overlap():
+    assert _stitch("Total revenue is 12", "2 thousand units") == "Total revenue is 12\n2 thousand units"
+
+
+def test_stitch_keeps_words_on_a_short_coincidental_overlap():
+    assert _stitch("cash and cash", "cash equivalents") == "cash and cash\ncash equivalents"
+
+
+def test_stitch_rejects_overlaps_that_cut_through_a_word():
+    tail = "x" * 40
+    left = "figures for 2023 " + "a" + tail
+    right = tail + "b rest of the chunk"
+    assert _stitch(left, right) == f"{left}\n{right}"
+
+
+def test_build_joins_unrelated_neighbours_without_losing_text():
+    builder = ContextBuilder(TokenCounter("cl100k_base"))
+    documents = [(_chunk("Segment revenue was 1,2", 0), 1.0), (_chunk("2 million won in total", 1), 0.9)]
+    context = builder.build(documents, budget=1000)
+    assert "1,2\n2 million" in context
@@ -34,31 +34,55 @@ export default function ChatInterface({ documentId }: ChatInterfaceProps) {
     setInput('');
     setIsLoading(true);
 
+    const assistantId = Date.now() + '-assistant';
+    const updateAssistant = (update: (msg: Message) => Message) => {
+      setMessages((prev) => prev.map((msg) => (msg.id === assistantId ? update(msg) : msg)));
+    };
+
     try {
       const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL;
-      const res = await fetch(`${backendUrl}/api/chat`, {
+      const res = await fetch(`${backendUrl}/api/chat/stream`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
         body: JSON.stringify({
           question: input,
           document_id: documentId,
         }),
       });
 
-      if (res.ok) {
-        const data = await res.json();
-        const assistantMessage: Message = {
-          id: Date.now() + '-assistant',
-          type: 'assistant',
-          content: data.answer || 'No response.',
-          sources: data.sources || [],
-        };
-        setMessages((prev) => [...prev, assistantMessage]);
+      if (res.ok && res.body) {
+        setMessages((prev) => [...prev, { id: assistantId, type: 'assistant', content: '', sources: [] }]);
+        // Render answer tokens as the server sends them
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const events = buffer.split('\n\n');
+          buffer = events.pop() || '';
+          for (const raw of events) {
+            const eventLine = raw.split('\n').find((line) => line.startsWith('event: '));
+            const dataLine = raw.split('\n').find((line) => line.startsWith('data: '));
+            if (!eventLine || !dataLine) continue;
+            const event = eventLine.slice('event: '.length);
+            const data = JSON.parse(dataLine.slice('data: '.length));
+            if (event === 'sources') {
+              updateAssistant((msg) => ({ ...msg, sources: data }));
+            } else if (event === 'token') {
+              updateAssistant((msg) => ({ ...msg, content: msg.content + data.text }));
+            } else if (event === 'error') {
+              updateAssistant((msg) => ({ ...msg, content: msg.content || data.message }));
+            }
+          }
+        }
+        updateAssistant((msg) => ({ ...msg, content: msg.content || 'No response.' }));
       } else {
         setMessages((prev) => [
           ...prev,
           {
-            id: Date.now() + '-assistant',
+            id: assistantId,
             type: 'assistant',
             content: 'Sorry, there was an error processing your request.',
           },
@@ -66,9 +90,9 @@ export default function ChatInterface({ documentId }: ChatInterfaceProps) {
       }
     } catch (err) {
       setMessages((prev) => [
-        ...prev,
+        ...prev.filter((msg) => msg.id !== assistantId),
         {
-          id: Date.now() + '-assistant',
+          id: assistantId,
           type: 'assistant',
           content: 'Network error. Please try again.',
         },
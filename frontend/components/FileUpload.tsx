@@ -53,7 +53,7 @@ export default function FileUpload({ onUploadComplete, onUploadError }: FileUplo
       });
 
       if (response.status === 200) {
-        const result = response.data;
+        const result = await waitForProcessing(backendUrl, response.data);
         setState({
           ...state,
           isUploading: false,
@@ -73,6 +73,21 @@ export default function FileUpload({ onUploadComplete, onUploadError }: FileUplo
     }
   };
 
+  const waitForProcessing = async (backendUrl: string | undefined, result: any) => {
+    // Ingestion runs in the background; poll until the document is ready
+    let status = result.status;
+    while (status && status !== 'processed') {
+      if (status === 'failed') {
+        throw new Error('Document processing failed.');
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const res = await axios.get(`${backendUrl}/api/documents/${result.document_id}/status`);
+      status = res.data.status;
+      result = { ...result, chunks_count: res.data.chunks_embedded };
+    }
+    return result;
+  };
+
   const handleDragOver = (e: React.DragEvent) => {
     // Prevent default to allow drop
     e.preventDefault();